@@ -0,0 +1,296 @@
+"""Benchmark load, rollup and per-interaction latency on synthetic counter data.
+
+    python benchmarks/bench.py --channels 20 --years 5 --output bench.json
+
+Each stage reports wall time over several runs and, for one extra run, the
+peak memory seen by tracemalloc, which only covers Python allocations, plus
+the peak Arrow memory pool usage and resident set growth, sampled in the
+background. Results are written as JSON so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from statistics import median
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.io as pio
+import pyarrow
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cycling import figures, model, rollups, store  # noqa: E402
+from cycling.engine import Engine  # noqa: E402
+from cycling.weather import load_weather  # noqa: E402
+
+END_DATE = "2025-06-30"
+
+
+def make_counts(n_channels, years, directions=2, seed=0):
+    """Hourly counts in the same shape as data/clean_cycle_data.feather."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(END_DATE) + pd.Timedelta(hours=23)
+    hours = pd.date_range(end - pd.DateOffset(years=years) + pd.Timedelta(hours=1), end, freq="h")
+
+    n_series = n_channels * directions
+    timestamps = np.tile(hours.values, n_series)
+    # Commute-shaped daily profile scaled by a per-series volume
+    shape = 1 + 8 * np.exp(-((hours.hour.values - 8) ** 2) / 4) + 6 * np.exp(-((hours.hour.values - 17) ** 2) / 6)
+    volume = rng.uniform(0.5, 10, n_series)
+    trips = rng.poisson(np.outer(volume, shape).ravel())
+
+    dt = pd.DatetimeIndex(timestamps)
+    return pd.DataFrame({
+        "channel": np.repeat([f"Counter {i:03d}" for i in range(n_channels)], directions * len(hours)),
+        "direction": np.tile(np.repeat([f"Direction {d}" for d in range(directions)], len(hours)), n_channels),
+        "ymd": dt.strftime("%Y-%m-%d"),
+        "ym": dt.strftime("%Y-%m"),
+        "y": dt.year,
+        "m": dt.month,
+        "week": dt.isocalendar().week.to_numpy().astype("int64"),
+        "weekday": dt.dayofweek + 1,
+        "hour": dt.hour,
+        "trips": trips,
+    })
+
+
+def make_weather(start, seed=0):
+    """Daily weather in the same shape as data/weather_data.csv."""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, END_DATE, freq="D")
+    mean_temp = 8 + 12 * np.sin(2 * np.pi * (days.dayofyear.values - 110) / 365) + rng.normal(0, 3, len(days))
+    rain = np.where(rng.random(len(days)) < 0.35, rng.gamma(1.5, 5, len(days)), 0).round(1)
+    snow = np.where((mean_temp < 0) & (rng.random(len(days)) < 0.3), rng.gamma(1.5, 3, len(days)), 0).round(1)
+    return pd.DataFrame({
+        "ymd": days.strftime("%Y-%m-%d"),
+        "year": days.year,
+        "month": days.month,
+        "day": days.day,
+        "max_temp": (mean_temp + 5).round(1),
+        "min_temp": (mean_temp - 5).round(1),
+        "mean_temp": mean_temp.round(1),
+        "total_rain": rain,
+        "total_snow": snow,
+        "total_precip": rain + snow,
+        "snow_on_ground": np.where(mean_temp < -2, rng.integers(0, 20, len(days)), 0).astype(float),
+        "max_gust_speed": rng.integers(20, 80, len(days)).astype(float),
+    })
+
+
+def _current_rss():
+    # Linux only, None elsewhere
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@contextmanager
+def sample_peaks(interval=0.001):
+    """Peak Arrow memory pool usage and RSS growth while the block runs, in MB.
+
+    Neither is visible to tracemalloc. Values are polled from a background
+    thread, so very short spikes can be missed.
+    """
+    baseline = {"arrow": pyarrow.total_allocated_bytes(), "rss": _current_rss()}
+    peaks = dict(baseline)
+    stopped = threading.Event()
+
+    def sample():
+        peaks["arrow"] = max(peaks["arrow"], pyarrow.total_allocated_bytes())
+        if baseline["rss"] is not None:
+            peaks["rss"] = max(peaks["rss"], _current_rss())
+
+    def poll():
+        while not stopped.wait(interval):
+            sample()
+
+    result = {}
+    thread = threading.Thread(target=poll, daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        stopped.set()
+        thread.join()
+        sample()
+        result["peak_arrow_mb"] = (peaks["arrow"] - baseline["arrow"]) / 1e6
+        result["peak_rss_delta_mb"] = (
+            (peaks["rss"] - baseline["rss"]) / 1e6 if baseline["rss"] is not None else None
+        )
+
+
+def measure(fn, repeat=5, setup=None):
+    """Time `fn` over `repeat` runs, after one untimed run with memory tracing."""
+    args = setup() if setup else ()
+    with sample_peaks() as native_peaks:
+        tracemalloc.start()
+        fn(*args)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+
+    return {
+        "runs": repeat,
+        "median_s": median(times),
+        "min_s": min(times),
+        "max_s": max(times),
+        "peak_traced_mb": peak_mb,
+        **native_peaks,
+    }
+
+
+def run(args, work_dir):
+    rng = random.Random(args.seed)
+    source = work_dir / "clean_cycle_data.feather"
+    weather_file = work_dir / "weather_data.csv"
+    store_dir = work_dir / "store"
+
+    df_counts = make_counts(args.channels, args.years, args.directions, args.seed)
+    df_counts.to_feather(source)
+    make_weather(df_counts.ymd.min(), args.seed).to_csv(weather_file, index=False)
+
+    results = {}
+
+    results["bootstrap"] = measure(
+        lambda: store.bootstrap(source, store_dir), repeat=min(args.repeat, 3)
+    )
+    manifest = store.read_manifest(store_dir)
+
+    results["cold_load"] = measure(
+        lambda: Engine(store_dir, manifest, load_weather(weather_file)), repeat=args.repeat
+    )
+    engine = Engine(store_dir, manifest, load_weather(weather_file))
+
+    df_hourly = store.load_counts(store_dir, manifest)
+    results["full_rollup"] = measure(
+        lambda: rollups.collapse_partials(rollups.build_partials(df_hourly)),
+        repeat=min(args.repeat, 3),
+    )
+    df_hourly = None
+
+    channels = engine.channels
+
+    def channel_switch(channel):
+        for level in ["channel_ymd", "channel_ym", "channel_y", "channel_combined"]:
+            engine.rows(level, channel)
+        engine.weekly_profile(channel)
+        engine.display_table(channel)
+
+    results["channel_switch"] = measure(
+        channel_switch, repeat=args.repeat * 4, setup=lambda: (rng.choice(channels),)
+    )
+
+    def random_weekdays():
+        return (rng.choice(channels), rng.sample(range(1, 8), rng.randint(1, 7)))
+
+    results["weekday_toggle"] = measure(
+        engine.hourly_profile, repeat=args.repeat * 4, setup=random_weekdays
+    )
+
+    results["model_fit"] = measure(
+        lambda: model.expected_counts(engine.rows("channel_combined")), repeat=args.repeat
+    )
+
+    # Rolling, year-to-date and year-over-year series for every channel
+    results["cumulative_metrics"] = measure(
+        lambda: Engine.cumulative.func(engine), repeat=args.repeat
+    )
+
+    # Comparison view profiles, one batched pass however many routes are picked
+    def compare(selected):
+        engine.weekly_profiles(selected)
+        engine.hourly_profiles(selected, [1, 2, 3, 4, 5])
+        engine.dry_days(selected)
+
+    for n in sorted({1, min(4, len(channels)), len(channels)}):
+        results[f"compare.{n}_routes"] = measure(
+            lambda: compare(channels[:n]), repeat=args.repeat * 4
+        )
+
+    channel = channels[0]
+    figure_inputs = {
+        "histories": (),
+        "total_counts_channel": ("Daily",),
+        "channel_counts": (channel, "Daily "),
+        "weekly": (channel,),
+        "hourly": (channel, [1, 2, 3, 4, 5]),
+        "temp_counts": (channel,),
+        "rain_counts": (channel,),
+        "expected_counts": (channel,),
+        "hour_heatmap": ("All years",),
+        "cumulative_counts": ("Rolling 28-day",),
+        "year_over_year": (channel,),
+        "compare_weekly": (tuple(channels[:4]),),
+        "compare_hourly": (tuple(channels[:4]), [1, 2, 3, 4, 5]),
+    }
+    for name, inputs in figure_inputs.items():
+        build = getattr(figures, f"build_{name}")
+        # Serialized the way st.plotly_chart does, so payload cost is included
+        results[f"figure_build.{name}"] = measure(
+            lambda: pio.to_json(build(engine, *inputs), validate=False), repeat=args.repeat
+        )
+        results[f"figure_build.{name}"]["payload_bytes"] = len(
+            pio.to_json(build(engine, *inputs), validate=False)
+        )
+
+    return {
+        "config": {
+            "channels": args.channels,
+            "years": args.years,
+            "directions": args.directions,
+            "hourly_rows": len(df_counts),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "pyarrow": pyarrow.__version__,
+            "plotly": plotly.__version__,
+        },
+        "results": results,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--directions", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cycling-bench-") as work_dir:
+        report = json.dumps(run(args, Path(work_dir)), indent=2)
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+
+def view(df):
+    """Zero-copy view of a cached frame for one caller.
+
+    The view shares the cached column buffers. Under pandas copy-on-write,
+    the default from pandas 3 which requirements.txt pins, any change the
+    caller makes, including adding or dropping columns, lands on a private
+    copy and never reaches the cache.
+    """
+    return df.copy(deep=False)
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with hit/miss counters.
+
+    Safe to share between Streamlit sessions, which run on separate threads.
+    Cached values are handed out as-is, so callers must not modify them.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+
+        # Computed outside the lock so slow misses don't block other sessions
+        value = compute()
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,87 @@
+"""Reduce the number of points sent to the browser for long daily series."""
+import numpy as np
+import pandas as pd
+
+
+def max_points_for_width(width, points_per_pixel=0.5):
+    """Points per trace worth sending for a chart `width` pixels wide."""
+    return max(int(width * points_per_pixel), 3)
+
+
+def _as_numbers(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("int64")
+    return values.astype("float64")
+
+
+def lttb(x, y, n_out):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each of `n_out - 2` equal
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket. `x` must be sorted.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_numbers(x)
+    y = _as_numbers(y)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        x_next = x[end:next_end].mean()
+        y_next = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - x_next) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (y_next - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return keep
+
+
+def downsample_lines(df, x, y, group, max_points):
+    """Apply `lttb` to each group's line, capping it at `max_points` points."""
+    parts = [
+        df_group.iloc[lttb(df_group[x].to_numpy(), df_group[y].to_numpy(), max_points)]
+        for _, df_group in df.sort_values(by=[group, x]).groupby(group, observed=True)
+    ]
+    if not parts:
+        return df.iloc[:0]
+    return pd.concat(parts, ignore_index=True)
+
+
+def active_intervals(df, group="channel", date_col="ymd", value_col="total_trips"):
+    """Collapse the days with data into one row per run of consecutive days.
+
+    `end` is exclusive (the day after the last active day), which is what
+    `px.timeline` expects.
+    """
+    df = df[df[value_col] > 0].sort_values(by=[group, date_col])
+
+    new_run = (df[date_col].diff() != pd.Timedelta(days=1)) | (
+        df[group] != df[group].shift()
+    )
+
+    return (
+        df.groupby(new_run.cumsum(), observed=True)
+        .agg(
+            **{group: (group, "first")},
+            start=(date_col, "min"),
+            end=(date_col, "max"),
+            days=(date_col, "size"),
+        )
+        .assign(end=lambda x: x.end + pd.Timedelta(days=1))
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,457 @@
+"""Headless aggregation engine behind the dashboard.
+
+Everything the dashboard plots comes from an `Engine`, which can be imported,
+profiled and run without Streamlit::
+
+    from cycling.engine import Engine, Query
+
+    engine = Engine.open("data/clean_cycle_data.feather", "data/store", "data/weather_data.csv")
+    engine.query(Query(group_by=("channel", "y"), start="2024-01-01"))
+"""
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Literal, Optional
+
+import numpy as np
+import pandas as pd
+
+from cycling import downsample, hourly, model, profiles, ranges, rollups, snapshot, store, weather
+from cycling.cache import view
+
+METRICS = ("total_trips", "weekly_share", "hourly_share")
+GROUP_KEYS = [col for col in store.COUNT_COLUMNS if col != "trips"]
+
+# Date column each channel table is sorted by within a channel, for date windows
+WINDOW_COLUMNS = {
+    "channel_ymd": "ymd",
+    "channel_ymd_lines": "ymd",
+    "channel_combined": "ymd",
+    "channel_expected": "ymd",
+    "channel_weekly_shares": "week_start",
+    "channel_ym": "ym",
+}
+
+WEEKDAYS = range(1, 8)
+
+# Rolling totals on each day, over this many calendar days
+ROLLING_DAYS = (7, 28, 365)
+
+
+@dataclass(frozen=True)
+class Query:
+    """A request for one metric, grouped by `group_by` after applying the filters.
+
+    `total_trips` sums trips per group. `weekly_share` and `hourly_share` are the
+    weekday and hour-of-day profiles from `cycling.profiles`, computed for each
+    group in `group_by`. `start` and `end` are inclusive dates; the share
+    metrics apply them to whole months.
+    """
+
+    metric: Literal["total_trips", "weekly_share", "hourly_share"] = "total_trips"
+    group_by: tuple[str, ...] = ()
+    channels: Optional[tuple[str, ...]] = None
+    weekdays: Optional[frozenset[int]] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+
+
+def weekday_mask(weekdays):
+    """Bitmask identifying a set of ISO weekdays (1 = Monday)."""
+    return sum(1 << (day - 1) for day in set(weekdays))
+
+
+def _filter(df, query):
+    if query.channels is not None:
+        df = df[df.channel.isin(query.channels)]
+    if query.weekdays is not None:
+        df = df[df.weekday.isin(query.weekdays)]
+
+    date_col = "ymd" if "ymd" in df.columns else "ym"
+    if query.start is not None:
+        start = pd.Timestamp(query.start)
+        df = df[df[date_col] >= (start if date_col == "ymd" else start.replace(day=1))]
+    if query.end is not None:
+        df = df[df[date_col] <= pd.Timestamp(query.end)]
+    return df
+
+
+class Engine:
+    """Rollups, weather and derived tables for one version of the counter store."""
+
+    def __init__(self, store_dir, manifest, weather, cube=None, hourly_cube=None):
+        self.store_dir = store_dir
+        self.manifest = manifest
+        self.weather = weather
+        self.artifacts = {}
+        if cube is None:
+            cube = store.load_rollups(store_dir, manifest)
+            self._derive(cube)
+        self.cube = cube
+        self.by_channel = rollups.index_by_channel(cube)
+        self.runs = {
+            level: ranges.channel_runs(cube[level].channel) for level in WINDOW_COLUMNS
+        }
+
+        # Prefix sums for O(log n) window totals and weekday profiles
+        self.daily_sums = ranges.PrefixSums.build(
+            cube["channel_ymd"].assign(active_days=cube["channel_ymd"].total_trips > 0),
+            "ymd",
+            ["total_trips", "active_days"],
+        )
+        self.weekly_sums = ranges.PrefixSums.build(
+            cube["channel_weekly_shares"],
+            "week_start",
+            [f"share_{day}" for day in WEEKDAYS] + [f"weeks_{day}" for day in WEEKDAYS],
+        )
+        if hourly_cube is not None:
+            self.hourly_cube = hourly_cube
+
+    @classmethod
+    def open(cls, source, store_dir, weather_file):
+        manifest = store.ensure_store(source, store_dir)
+        return cls(store_dir, manifest, weather.load_weather(weather_file))
+
+    @classmethod
+    def mapped(cls, store_dir, manifest, weather, snapshot_dir):
+        """An engine whose tables are memory-mapped from a snapshot in `snapshot_dir`.
+
+        The snapshot is built and written first if it doesn't exist yet.
+        """
+        if not snapshot.exists(snapshot_dir):
+            engine = cls(store_dir, manifest, weather)
+            snapshot.write_frames(
+                engine.cube, snapshot_dir, arrays=hourly.to_arrays(engine.hourly_cube)
+            )
+        return cls(
+            store_dir,
+            manifest,
+            weather,
+            cube=snapshot.map_frames(snapshot_dir),
+            hourly_cube=hourly.from_arrays(snapshot.map_arrays(snapshot_dir)),
+        )
+
+    def _derive(self, cube):
+        cube["combined_ymd"] = weather.join(cube["ymd"], self.weather)
+        cube["channel_combined"] = weather.join(cube["channel_ymd"], self.weather)
+
+        # Expected counts from every channel's weather model, fitted in one batch
+        cube["channel_expected"] = model.expected_counts(cube["channel_combined"])
+
+        # Each week's weekday shares, summed over any window by `weekly_profile`
+        cube["channel_weekly_shares"] = profiles.weekly_shares(cube["channel_ymd"])
+
+        # Downsampled forms of the daily series, sized for the 1000px wide charts
+        cube["channel_intervals"] = downsample.active_intervals(cube["channel_ymd"])
+        cube["channel_ymd_lines"] = downsample.downsample_lines(
+            cube["channel_ymd"],
+            x="ymd",
+            y="total_trips",
+            group="channel",
+            max_points=downsample.max_points_for_width(1000),
+        )
+
+    @cached_property
+    def hourly_cube(self):
+        """Every hourly count as a dense `hourly.HourlyCube`, built from the store on first use."""
+        start, end = self.date_range
+        return hourly.build(
+            store.scan_counts(self.store_dir, self.manifest),
+            channels=self.channels,
+            directions=sorted(self.cube["direction_hour"].direction.unique().tolist()),
+            start=start,
+            end=end,
+        )
+
+    @property
+    def version(self):
+        return store.store_version(self.manifest)
+
+    @property
+    def channels(self):
+        return sorted(self.cube["channel_ymd"].channel.unique().tolist())
+
+    @property
+    def date_range(self):
+        return self.cube["channel_ymd"].ymd.min(), self.cube["channel_ymd"].ymd.max()
+
+    def rows(self, level, channel=None):
+        """A rollup level, or just one channel's rows of it via the channel index.
+
+        Returns a view sharing the engine's buffers, which callers may modify.
+        """
+        if channel is None:
+            return view(self.cube[level])
+        return view(self.by_channel[level].get(channel, self.cube[level].iloc[:0]))
+
+    def load_artifacts(self, artifacts):
+        """Serve per-channel results from a bundle built by `cycling.precompute`."""
+        self.artifacts = artifacts
+
+    def _artifact(self, channel, name):
+        return self.artifacts.get(channel, {}).get(name)
+
+    def covers(self, start=None, end=None):
+        """Whether the window from `start` to `end` includes every day of data."""
+        min_date, max_date = self.date_range
+        return (start is None or pd.Timestamp(start) <= min_date) and (
+            end is None or pd.Timestamp(end) >= max_date
+        )
+
+    def window_rows(self, level, channel=None, start=None, end=None):
+        """Rows of a channel table from `start` to `end` (inclusive).
+
+        `channel` is one channel, a list of them, or None for all. Rows are
+        found by binary search within each channel's date-sorted rows. Monthly
+        and yearly tables include the months or years the window touches.
+        """
+        if level in ("channel_y", "channel_yw"):
+            if channel is None or isinstance(channel, str):
+                df = self.rows(level, channel)
+            else:
+                df = self.rows(level)
+                df = df[df.channel.isin(channel).to_numpy()]
+            years = df.y.to_numpy()
+            mask = np.ones(len(df), dtype=bool)
+            if start is not None:
+                mask &= years >= pd.Timestamp(start).year
+            if end is not None:
+                mask &= years <= pd.Timestamp(end).year
+            return df[mask]
+
+        if WINDOW_COLUMNS[level] == "ym" and start is not None:
+            start = pd.Timestamp(start).replace(day=1)
+        return view(
+            ranges.slice_window(
+                self.cube[level], WINDOW_COLUMNS[level], self.runs[level], channel, start, end
+            )
+        )
+
+    def window_totals(self, channel, start=None, end=None):
+        """Total trips, days and days with counts for one channel over a window."""
+        totals = self.daily_sums.total(channel, start, end)
+        return {
+            "total_trips": int(totals.total_trips),
+            "days": int(self.daily_sums.count(channel, start, end)),
+            "active_days": int(totals.active_days),
+        }
+
+    def daily_lines(self, start=None, end=None):
+        """Every channel's daily series over a window, downsampled for the line chart."""
+        if self.covers(start, end):
+            return self.rows("channel_ymd_lines")
+        return downsample.downsample_lines(
+            self.window_rows("channel_ymd", start=start, end=end),
+            x="ymd",
+            y="total_trips",
+            group="channel",
+            max_points=downsample.max_points_for_width(1000),
+        )
+
+    @cached_property
+    def cumulative(self):
+        """Rolling, year-to-date and year-over-year totals for every channel and day.
+
+        Row for row like `channel_ymd`. Every column comes from one vectorized
+        pass over the daily prefix sums, two lookups per value.
+        """
+        df = self.cube["channel_ymd"][["channel", "ymd", "total_trips"]].copy()
+        for days in ROLLING_DAYS:
+            df[f"rolling_{days}"] = self.daily_sums.rolling("total_trips", days).astype("int64")
+        df["ytd"] = self.daily_sums.year_to_date("total_trips").astype("int64")
+        df["ytd_last_year"] = self.daily_sums.year_to_date("total_trips", years_back=1).astype("int64")
+        df["yoy_change"] = (df.ytd / df.ytd_last_year.where(df.ytd_last_year > 0)) - 1
+        return df
+
+    def cumulative_rows(self, channel=None, start=None, end=None):
+        return view(
+            ranges.slice_window(
+                self.cumulative, "ymd", self.runs["channel_ymd"], channel, start, end
+            )
+        )
+
+    def weekly_profile(self, channel, start=None, end=None):
+        """Average share of the weekly count on each weekday, over the days in the window.
+
+        Weeks cut by the window only count the days inside it.
+        """
+        return self.weekly_profiles([channel], start, end)
+
+    def weekly_profiles(self, channels, start=None, end=None):
+        """`weekly_profile` for several channels.
+
+        Weeks entirely inside the window are summed from the weekly prefix
+        sums, in one batched lookup for the full range. Only the days of the
+        partial weeks at either edge are grouped into shares.
+        """
+        if start is None and end is None:
+            totals = self.weekly_sums.totals(channels)
+        else:
+            totals = np.zeros((len(channels), 2 * len(WEEKDAYS)))
+            edge_days = []
+            for i, channel in enumerate(channels):
+                lo, hi = self._whole_weeks(channel, start, end)
+                totals[i] = self.weekly_sums.sums[hi] - self.weekly_sums.sums[lo]
+                edge_days.append(self._edge_days(channel, lo, hi, start, end))
+
+            edge_days = pd.concat(edge_days, ignore_index=True)
+            if len(edge_days):
+                edges = (
+                    profiles.weekly_shares(edge_days)
+                    .drop(columns=["y", "week", "week_start", "week_end"])
+                    .groupby("channel", observed=True)
+                    .sum()
+                )
+                rows = edges.index.astype(str).get_indexer(list(channels))
+                found = rows >= 0
+                totals[found] += edges.to_numpy()[rows[found]]
+
+        shares, weeks = totals[:, : len(WEEKDAYS)], totals[:, len(WEEKDAYS) :]
+        counted = weeks > 0
+        return pd.DataFrame(
+            {
+                "channel": np.repeat(list(channels), len(WEEKDAYS))[counted.ravel()],
+                "weekday": np.tile(WEEKDAYS, len(channels))[counted.ravel()],
+                "weekly_mean": shares[counted] / weeks[counted],
+            }
+        )
+
+    def _whole_weeks(self, channel, start, end):
+        # Rows (lo, hi) of the channel's weeks whose days all fall in the window
+        table = self.cube["channel_weekly_shares"]
+        first, stop = self.runs["channel_weekly_shares"].get(channel, (0, 0))
+        lo, hi = first, stop
+        if start is not None:
+            week_start = table.week_start.to_numpy()[first:stop]
+            lo = first + np.searchsorted(week_start, np.datetime64(pd.Timestamp(start)), side="left")
+        if end is not None:
+            week_end = table.week_end.to_numpy()[first:stop]
+            hi = first + np.searchsorted(week_end, np.datetime64(pd.Timestamp(end)), side="right")
+        return lo, max(lo, hi)
+
+    def _edge_days(self, channel, lo, hi, start, end):
+        # Daily rows in the window outside the whole weeks lo..hi
+        days = self.window_rows("channel_ymd", channel, start, end)
+        if hi > lo:
+            table = self.cube["channel_weekly_shares"]
+            ymd = days.ymd.to_numpy()
+            days = days[(ymd < table.week_start.to_numpy()[lo]) | (ymd > table.week_end.to_numpy()[hi - 1])]
+        return days
+
+    def hourly_profile(self, channel, weekdays, start=None, end=None):
+        precomputed = self._artifact(channel, "hourly_profiles")
+        if precomputed is not None and weekdays and self.covers(start, end):
+            return view(precomputed[weekday_mask(weekdays)])
+        return self.hourly_profiles([channel], weekdays, start, end)
+
+    def hourly_profiles(self, channels, weekdays, start=None, end=None):
+        """`hourly_profile` for several channels in one grouped pass.
+
+        The full range is served from the monthly `channel_hour` rollup. Other
+        windows are summed by day from the hourly cube, so they start and end
+        on the selected days rather than whole months.
+        """
+        if self.covers(start, end):
+            df = self.rows("channel_hour")
+            return profiles.hourly_profile(df[df.channel.isin(channels).to_numpy()], weekdays)
+
+        known = [channel for channel in channels if channel in self.hourly_cube.channels]
+        df = self.hourly_cube.select(known, start, end).weekday_hours(weekdays)
+        return profiles.hourly_profile(df, weekdays)
+
+    def weather_days(self, channel, all_of=0, any_of=0, start=None, end=None):
+        """Days with counts in the window matching the `weather` condition bits.
+
+        `all_of` and `any_of` are combinations of flags like `weather.DRY`,
+        see `weather.select`.
+        """
+        df = self.window_rows("channel_combined", channel, start, end)
+        mask = weather.select(df.conditions.to_numpy(), all_of, any_of)
+        mask &= df.total_trips.to_numpy() > 0
+        return df[mask]
+
+    def dry_days(self, channel, start=None, end=None):
+        """Days with counts without rain, snow or snow on the ground."""
+        return self.weather_days(channel, all_of=weather.DRY, start=start, end=end)
+
+    def rain_days(self, channel, start=None, end=None):
+        """Days with counts and rain, excluding freezing days."""
+        return self.weather_days(
+            channel, all_of=weather.RAIN, any_of=weather.ABOVE_FREEZING, start=start, end=end
+        )
+
+    def expected_counts(self, channel, start=None, end=None):
+        """Actual and weather-adjusted expected trips for each day, with anomaly flags."""
+        return self.window_rows("channel_expected", channel, start, end)
+
+    def anomalies(self, start=None, end=None):
+        """Anomalous days in the window across all channels, most recent first."""
+        df = self.window_rows("channel_expected", start=start, end=end)
+        return df[df.anomaly.to_numpy()].sort_values("ymd", ascending=False)
+
+    def display_table(self, channel, start=None, end=None):
+        """Daily counts and weather for one channel, formatted for display."""
+        precomputed = self._artifact(channel, "display_table")
+        if precomputed is not None and self.covers(start, end):
+            return view(precomputed)
+
+        df_display = (
+            self.window_rows("channel_combined", channel, start, end)
+            .drop(columns=["channel", "y", "m", "weekday", "ym", "year", "month", "day", "conditions"])
+            .assign(ymd=lambda x: x.ymd.dt.date)
+            .rename(columns={"ymd": "Date"})
+            .set_index("Date")
+        )
+
+        df_display.columns = df_display.columns.str.title().str.replace("_", " ")
+        return df_display
+
+    def query(self, query):
+        if query.metric not in METRICS:
+            raise ValueError(f"Unknown metric {query.metric!r}, expected one of {METRICS}")
+        unknown = set(query.group_by) - set(GROUP_KEYS)
+        if unknown:
+            raise ValueError(f"Cannot group by {sorted(unknown)}, expected keys from {GROUP_KEYS}")
+
+        group_by = list(query.group_by)
+
+        if query.metric == "weekly_share":
+            df = _filter(self.cube["channel_week_weekday"], query)
+            return profiles.weekly_profile(df, by=group_by)
+        if query.metric == "hourly_share":
+            df = _filter(self.cube["channel_hour"], query)
+            return profiles.hourly_profile(df, query.weekdays or range(1, 8), by=group_by)
+
+        df, value_col = self._covering_rows(query)
+        df = _filter(df, query)
+        if not group_by:
+            return pd.DataFrame({"total_trips": [df[value_col].sum()]})
+        return rollups.trip_counts(df, group_by, value_col=value_col)
+
+    def _covering_rows(self, query):
+        # The smallest rollup with every column the query needs, otherwise a
+        # scan of the hourly rows with the filters pushed down to the store.
+        needed = set(query.group_by)
+        if query.channels is not None:
+            needed.add("channel")
+        if query.weekdays is not None:
+            needed.add("weekday")
+        if query.start is not None or query.end is not None:
+            needed.add("ymd")
+
+        covering = [
+            self.cube[level]
+            for level, cols in rollups.ROLLUP_LEVELS.items()
+            if needed <= set(cols)
+        ]
+        if covering:
+            return min(covering, key=len), "total_trips"
+
+        df = store.load_counts(
+            self.store_dir,
+            self.manifest,
+            start=query.start,
+            end=query.end,
+            channels=query.channels,
+            columns=sorted(needed | {"trips"}),
+        )
+        return df, "trips"
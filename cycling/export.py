@@ -0,0 +1,115 @@
+"""Chunked CSV and Parquet exports of the hourly counts, cached on disk.
+
+Exports stream record batches from the partitioned store straight into the
+output file, so memory use is bounded by the batch size however large the
+extract is. Finished files are kept under `<export_dir>/<version>/`, keyed
+by the channels, date range and format, and reused until the store changes.
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.parquet as pq
+
+from cycling import store
+
+MIME_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Extracts kept per store version, least recently used ones are deleted first
+MAX_FILES = 32
+
+
+def export_name(channels, start, end, fmt):
+    """File name identifying one extract. Channel order doesn't matter."""
+    key = repr((sorted(channels) if channels is not None else None, str(start), str(end)))
+    return f"{hashlib.sha1(key.encode()).hexdigest()[:16]}.{fmt}"
+
+
+def _csv_batch(batch):
+    # Plain strings and dates, in the formats of the source data
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        elif pa.types.is_timestamp(column.type) and name in store.DATE_FORMATS:
+            column = pc.strftime(column, format=store.DATE_FORMATS[name])
+        elif pa.types.is_timestamp(column.type):
+            column = column.cast(pa.date32())
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def write_csv(batches, path):
+    writer = None
+    with pa.OSFile(str(path), "wb") as sink:
+        for batch in batches:
+            batch = _csv_batch(batch)
+            if writer is None:
+                writer = csv.CSVWriter(sink, batch.schema)
+            writer.write_batch(batch)
+        if writer is not None:
+            writer.close()
+        else:
+            sink.write(",".join(store.COUNT_COLUMNS).encode() + b"\n")
+
+
+def write_parquet(batches, path):
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(str(path), batch.schema)
+        writer.write_batch(batch, row_group_size=store.ROW_GROUP_SIZE)
+    if writer is not None:
+        writer.close()
+    else:
+        empty = store.normalize_schema(pd.DataFrame(columns=store.COUNT_COLUMNS))
+        pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), str(path))
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def _prune(export_dir, version):
+    for path in Path(export_dir).iterdir():
+        if path.is_dir() and path.name != version:
+            shutil.rmtree(path, ignore_errors=True)
+
+    files = sorted(
+        (path for path in (Path(export_dir) / version).iterdir() if path.suffix != ".tmp"),
+        key=lambda path: path.stat().st_mtime_ns,
+    )
+    for path in files[:-MAX_FILES]:
+        path.unlink(missing_ok=True)
+
+
+def export(store_dir, manifest, export_dir, channels=None, start=None, end=None, fmt="csv"):
+    """Path to an extract of the hourly counts, building it if it isn't cached.
+
+    `channels`, `start` and `end` filter the rows as in `store.load_counts`.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {sorted(WRITERS)}")
+
+    version = store.store_version(manifest)
+    version_dir = Path(export_dir) / version
+    path = version_dir / export_name(channels, start, end, fmt)
+    if path.exists():
+        # Mark as recently used
+        os.utime(path)
+        return path
+
+    version_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    WRITERS[fmt](
+        store.scan_counts(store_dir, manifest, start=start, end=end, channels=channels),
+        tmp_path,
+    )
+    os.replace(tmp_path, path)
+
+    _prune(export_dir, version)
+    return path
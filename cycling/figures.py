@@ -0,0 +1,798 @@
+"""Plotly figures for the dashboard, built from an `Engine`."""
+import pandas as pd
+import plotly.express as px
+
+from cycling import downsample, hourly
+
+# Columns of `Engine.cumulative` behind the rolling and year-to-date options
+CUMULATIVE_MEASURES = {
+    "Rolling 7-day": "rolling_7",
+    "Rolling 28-day": "rolling_28",
+    "Rolling 365-day": "rolling_365",
+    "Year to date": "ytd",
+}
+
+
+def channel_colors(channels):
+    return dict(zip(channels,px.colors.qualitative.Alphabet[0:len(channels)]))
+
+
+def build_histories(engine):
+
+    # One bar per run of consecutive days with data instead of a marker per day
+    fig_histories = px.timeline(
+        engine.rows("channel_intervals"),
+        x_start="start",
+        x_end="end",
+        y="channel",
+        color="channel",
+        color_discrete_map=channel_colors(engine.channels),
+        hover_data="days",
+    )
+
+    # Axis formatting
+    fig_histories.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Date",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat="%b\n%Y",
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Counter",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        showlegend=True,
+        legend=dict(
+            title=dict(text="Route", font_size=20),
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1,
+            font=dict(size=16),
+        ),
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_histories
+
+
+def build_total_counts_channel(engine, date_format, start=None, end=None):
+
+    if date_format == "Daily":
+        df_plot = engine.daily_lines(start, end)
+        x_var = "ymd"
+        x_label = "Date"
+    elif date_format == "Weekly":
+        df_plot = engine.window_rows("channel_yw", start=start, end=end)
+        x_var = "week"
+        x_label = "Week Number"
+    elif date_format == "Monthly":
+        df_plot = engine.window_rows("channel_ym", start=start, end=end)
+        x_var = "ym"
+        x_label = "Month"
+    else:
+        df_plot = engine.window_rows("channel_y", start=start, end=end)
+        x_var = "y"
+        x_label = "Year"
+
+    fig_total_counts_channel = px.line(
+        df_plot,
+        x=x_var,
+        y="total_trips",
+        color="channel",
+        color_discrete_map=channel_colors(engine.channels)
+    )
+
+    # Axis formatting
+    fig_total_counts_channel.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text =x_label,
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = f"Total {date_format.lower()} count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_total_counts_channel
+
+
+def build_channel_counts(engine, selected_channel, date_format_channel, start=None, end=None):
+
+    if date_format_channel == "Daily ":
+        df_channel = engine.window_rows("channel_ymd", selected_channel, start, end)
+        x_var = "ymd"
+    elif date_format_channel == "Monthly ":
+        df_channel = engine.window_rows("channel_ym", selected_channel, start, end)
+        x_var = "ym"
+    else:
+        df_channel = engine.window_rows("channel_y", selected_channel, start, end)
+        x_var = "y"
+
+    fig_channel_counts = px.bar(
+        df_channel,
+        x=x_var,
+        y="total_trips",
+        hover_data=x_var,
+    )
+
+    if date_format_channel == "Yearly ":
+
+        # Axis formatting
+        fig_channel_counts.update_layout(
+            dict(
+                xaxis=dict(
+                    title=dict(
+                        text = "Date",
+                        font=dict(
+                            size = 20
+                        )
+                    ),
+                    tickfont = dict(
+                        size = 20
+                    ),
+                    tickformat="array",
+                    tickvals=df_channel.y.unique(),
+                    ticktext=df_channel.y.unique(),
+                ),
+                autosize=False,
+                width=1000,
+                height=600,
+                margin=dict(l=0, r=0, t=0, b=0),
+                font_color="black",
+            )
+        )
+
+    else:
+        fig_channel_counts.update_layout(
+            dict(
+                xaxis=dict(
+                    title=dict(
+                        text = "Date",
+                        font=dict(
+                            size = 20
+                        )
+                    ),
+                    tickfont = dict(
+                        size = 20
+                    ),
+                    tickformat="%b\n%Y",
+                ),
+                autosize=False,
+                width=1000,
+                height=600,
+                margin=dict(l=0, r=0, t=0, b=0),
+                font_color="black",
+            )
+        )
+
+    fig_channel_counts.update_layout(
+            dict(
+                yaxis=dict(
+                    title=dict(
+                        text = f"Total {date_format_channel.strip().lower()} count",
+                        font= dict(
+                            size = 20
+                        ),
+                    ),
+                    tickfont = dict(
+                        size = 20
+                    ),
+            ),
+            autosize=False,
+            width=500,
+            height=400,
+            margin=dict(l=0, r=0, t=0, b=0),
+            font_color="black",
+            )
+        )
+
+    fig_channel_counts.update_traces(
+        # marker_color="red",
+    )
+
+    return fig_channel_counts
+
+
+def build_weekly(engine, selected_channel, start=None, end=None):
+
+    fig_weekly = px.bar(
+        engine.weekly_profile(selected_channel, start, end),
+        x="weekday",
+        y="weekly_mean",
+        text_auto="0.1%",
+    )
+
+    # Axis formatting
+    fig_weekly.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Day of week",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickangle=30,
+                tickmode="array",
+                tickvals=[1, 2, 3, 4, 5, 6, 7],
+                ticktext=[
+                    "Monday",
+                    "Tuesday",
+                    "Wednesday",
+                    "Thursday",
+                    "Friday",
+                    "Saturday",
+                    "Sunday",
+            ],
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Average percent of weekly count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat=".0%",
+        ),
+        autosize=False,
+        width=500,
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    fig_weekly.update_traces(
+        textposition="inside",
+        textfont_size=14,
+    )
+
+    return fig_weekly
+
+
+def build_hourly(engine, selected_channel, selected_days, start=None, end=None, profile_cache=None):
+
+    if profile_cache is None:
+        df_hour_mean = engine.hourly_profile(selected_channel, selected_days, start, end)
+    else:
+        df_hour_mean = profile_cache.get_or_compute(
+            (engine.version, selected_channel, frozenset(selected_days), start, end),
+            lambda: engine.hourly_profile(selected_channel, selected_days, start, end),
+        )
+
+    fig_hourly = px.line(
+    df_hour_mean,
+    x="hour",
+    y="hourly_mean",
+    markers=True,
+    color="direction",
+    )
+
+    # Axis formatting
+    fig_hourly.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Hour of Day",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickmode="array",
+                tickvals=[0, 3, 6, 9, 12, 15, 18, 21],
+                ticktext=[
+                    "12 AM",
+                    "3 AM",
+                    "6 AM",
+                    "9 AM",
+                    "12 PM",
+                    "3 PM",
+                    "6 PM",
+                    "9 PM",
+                ],
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Average percent of daily count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat=".0%",
+                range=[0, 0.1],
+        ),
+        legend=dict(
+            title=dict(text="Direction", font_size=20),
+            yanchor="top",
+            y=1,
+            xanchor="right",
+            x=1,
+            font=dict(size=16),
+            ),
+        autosize=False,
+        width=500,
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_hourly
+
+
+def build_temp_counts(engine, selected_channel, start=None, end=None):
+
+    fig_temp_counts = px.scatter(
+        engine.dry_days(selected_channel, start, end),
+        x="mean_temp",
+        y="total_trips",
+    )
+
+    # Axis formatting
+    fig_temp_counts.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Mean daily temperature",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Total daily count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        autosize=False,
+        width=500,
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_temp_counts
+
+
+def build_rain_counts(engine, selected_channel, start=None, end=None):
+
+    fig_rain_counts = px.scatter(
+        engine.rain_days(selected_channel, start, end),
+        x="total_rain",
+        y="total_trips",
+        color="mean_temp",
+    )
+
+    # Axis formatting
+    fig_rain_counts.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Total daily rain (mm)",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Total daily count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        coloraxis_colorbar=dict(
+            title="Mean temp",
+        ),
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_rain_counts
+
+
+def build_expected_counts(engine, selected_channel, start=None, end=None):
+
+    df_expected = engine.expected_counts(selected_channel, start, end)
+
+    fig_expected_counts = px.line(
+        df_expected,
+        x="ymd",
+        y=["total_trips", "expected_trips"],
+    )
+
+    # Anomalous days on top of the lines
+    df_anomalies = df_expected[df_expected.anomaly]
+    fig_expected_counts.add_scatter(
+        x=df_anomalies.ymd,
+        y=df_anomalies.total_trips,
+        mode="markers",
+        marker=dict(color="red", size=8),
+        name="anomaly",
+    )
+
+    fig_expected_counts.for_each_trace(
+        lambda trace: trace.update(
+            name={"total_trips": "actual", "expected_trips": "expected"}.get(trace.name, trace.name)
+        )
+    )
+
+    # Axis formatting
+    fig_expected_counts.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Date",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat="%b\n%Y",
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Total daily count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        legend_title_text="",
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_expected_counts
+
+
+def build_hour_heatmap(engine, year, start=None, end=None):
+
+    hourly_cube = engine.hourly_cube.select(start=start, end=end)
+    if year != "All years":
+        hourly_cube = hourly_cube.select(start=f"{year}-01-01", end=f"{year}-12-31")
+
+    # Days of a leap year label the day-of-year axis
+    fig_hour_heatmap = px.imshow(
+        hourly_cube.hour_by_day_of_year(),
+        x=pd.date_range("2024-01-01", periods=366, freq="D"),
+        y=list(range(24)),
+        aspect="auto",
+        color_continuous_scale="Viridis",
+        labels=dict(x="Day of year", y="Hour of day", color="Mean trips"),
+    )
+
+    # Axis formatting
+    fig_hour_heatmap.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Day of year",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat="%b",
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Hour of day",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                autorange="reversed",
+        ),
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_hour_heatmap
+
+
+def build_cumulative_counts(engine, measure, start=None, end=None):
+
+    y_var = CUMULATIVE_MEASURES[measure]
+    df_plot = downsample.downsample_lines(
+        engine.cumulative_rows(start=start, end=end),
+        x="ymd",
+        y=y_var,
+        group="channel",
+        max_points=downsample.max_points_for_width(1000),
+    )
+
+    fig_cumulative_counts = px.line(
+        df_plot,
+        x="ymd",
+        y=y_var,
+        color="channel",
+        color_discrete_map=channel_colors(engine.channels),
+    )
+
+    # Axis formatting
+    fig_cumulative_counts.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Date",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = f"{measure} count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        legend_title_text="Route",
+        autosize=False,
+        width=1000,
+        height=600,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_cumulative_counts
+
+
+def build_year_over_year(engine, selected_channel, start=None, end=None):
+
+    # Each year's year-to-date count, lined up on the days of a leap year
+    df_plot = engine.cumulative_rows(selected_channel, start, end)
+    df_plot = df_plot.assign(
+        year=df_plot.ymd.dt.year.astype(str),
+        day=pd.to_datetime("2024-01-01") + pd.to_timedelta(hourly.day_of_leap_year(df_plot.ymd), unit="D"),
+    )
+
+    fig_year_over_year = px.line(
+        df_plot,
+        x="day",
+        y="ytd",
+        color="year",
+        hover_data={"ymd": True, "day": False, "yoy_change": ":.1%"},
+    )
+
+    # Axis formatting
+    fig_year_over_year.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = "Date",
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+                tickformat="%b",
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = "Year to date count",
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        legend_title_text="",
+        autosize=False,
+        width=500,
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+
+    return fig_year_over_year
+
+
+def _comparison_layout(fig, x_title, y_title, width=500, height=400):
+
+    # Axis formatting shared by the comparison charts
+    fig.update_layout(
+        dict(
+            xaxis=dict(
+                title=dict(
+                    text = x_title,
+                    font=dict(
+                        size = 20
+                    )
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+            ),
+            yaxis=dict(
+                title=dict(
+                    text = y_title,
+                    font= dict(
+                        size = 20
+                    ),
+                ),
+                tickfont = dict(
+                    size = 20
+                ),
+        ),
+        legend_title_text="Route",
+        autosize=False,
+        width=width,
+        height=height,
+        margin=dict(l=0, r=0, t=0, b=0),
+        font_color="black",
+        )
+    )
+    return fig
+
+
+def build_compare_counts(engine, selected_channels, start=None, end=None):
+
+    fig_compare_counts = px.line(
+        engine.window_rows("channel_ym", list(selected_channels), start, end),
+        x="ym",
+        y="total_trips",
+        color="channel",
+        color_discrete_map=channel_colors(engine.channels),
+    )
+    fig_compare_counts.update_xaxes(tickformat="%b\n%Y")
+
+    return _comparison_layout(fig_compare_counts, "Month", "Total monthly count")
+
+
+def build_compare_weekly(engine, selected_channels, start=None, end=None):
+
+    fig_compare_weekly = px.bar(
+        engine.weekly_profiles(list(selected_channels), start, end),
+        x="weekday",
+        y="weekly_mean",
+        color="channel",
+        barmode="group",
+        color_discrete_map=channel_colors(engine.channels),
+    )
+    fig_compare_weekly.update_xaxes(
+        tickmode="array",
+        tickvals=[1, 2, 3, 4, 5, 6, 7],
+        ticktext=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+    )
+    fig_compare_weekly.update_yaxes(tickformat=".0%")
+
+    return _comparison_layout(fig_compare_weekly, "Day of week", "Percent of weekly count")
+
+
+def build_compare_hourly(engine, selected_channels, selected_days, start=None, end=None):
+
+    fig_compare_hourly = px.line(
+        engine.hourly_profiles(list(selected_channels), selected_days, start, end),
+        x="hour",
+        y="hourly_mean",
+        color="channel",
+        line_dash="direction",
+        color_discrete_map=channel_colors(engine.channels),
+    )
+    fig_compare_hourly.update_yaxes(tickformat=".0%")
+
+    return _comparison_layout(fig_compare_hourly, "Hour of day", "Percent of daily count")
+
+
+def build_compare_temp_counts(engine, selected_channels, start=None, end=None):
+
+    fig_compare_temp_counts = px.scatter(
+        engine.dry_days(list(selected_channels), start, end),
+        x="mean_temp",
+        y="total_trips",
+        color="channel",
+        color_discrete_map=channel_colors(engine.channels),
+    )
+
+    return _comparison_layout(
+        fig_compare_temp_counts, "Mean daily temperature", "Total daily count"
+    )
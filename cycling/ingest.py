@@ -0,0 +1,43 @@
+"""Append new days of hourly counts to the counter store.
+
+    python -m cycling.ingest new_counts.csv [more files...]
+
+Accepts csv, feather or parquet files with the same columns as
+data/clean_cycle_data.feather.
+"""
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from cycling import store
+
+STORE_DIR = Path(__file__).parent.parent/'data/store'
+
+
+def read_counts(path):
+    path = Path(path)
+    if path.suffix == ".csv":
+        return pd.read_csv(path, dtype={"ymd": str, "ym": str})
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_feather(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--store", type=Path, default=STORE_DIR)
+    args = parser.parse_args()
+
+    df_new = pd.concat([read_counts(path) for path in args.files], ignore_index=True)
+    manifest = store.ingest(df_new, args.store)
+
+    print(
+        f"Store at version {manifest['version']} "
+        f"({len(df_new)} rows, months {sorted(df_new.ym.unique())})"
+    )
+
+
+if __name__ == "__main__":
+    main()
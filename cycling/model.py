@@ -0,0 +1,99 @@
+"""Expected daily trips per channel given the weather, weekday and season.
+
+Each channel gets its own linear model of log daily trips, fitted for all
+channels in one batch. The normal equations of each channel's contiguous
+rows are stacked and solved in a single call:
+
+    log1p(trips) ~ weekday + season + temperature + rain + snow
+
+Days whose actual count falls far from the expected one, relative to that
+channel's typical error, are flagged as anomalies.
+"""
+import numpy as np
+import pandas as pd
+
+# Small ridge penalty so channels with a short history still get a stable fit
+RIDGE = 1e-3
+
+# Residuals beyond this many robust standard deviations are anomalies
+ANOMALY_THRESHOLD = 3.0
+
+
+def design_matrix(df):
+    """Model features for each row of a daily channel × weather table."""
+    day_of_year = 2 * np.pi * df.ymd.dt.dayofyear.to_numpy() / 365.25
+    mean_temp = df.mean_temp.fillna(0).to_numpy()
+    weekday = df.weekday.to_numpy()
+
+    features = [
+        np.ones(len(df)),
+        # Monday is the baseline
+        *((weekday == day).astype(float) for day in range(2, 8)),
+        np.sin(day_of_year),
+        np.cos(day_of_year),
+        np.sin(2 * day_of_year),
+        np.cos(2 * day_of_year),
+        mean_temp / 10,
+        (mean_temp / 10) ** 2,
+        np.log1p(df.total_rain.fillna(0).clip(lower=0).to_numpy()),
+        np.log1p(df.total_snow.fillna(0).clip(lower=0).to_numpy()),
+        (df.snow_on_ground.fillna(0).to_numpy() > 0).astype(float),
+    ]
+    return np.column_stack(features)
+
+
+def _channel_starts(channel):
+    return np.flatnonzero(channel.ne(channel.shift()).to_numpy())
+
+
+def fit(df):
+    """Coefficients of every channel's model, one row per channel.
+
+    `df` is the `channel_combined` table: rows sorted by channel, with
+    counts and weather for each day. Days without trips are left out, as
+    they are usually counter outages rather than days nobody rode.
+    """
+    df = df[df.total_trips > 0]
+    X = design_matrix(df)
+    y = np.log1p(df.total_trips.to_numpy())
+
+    starts = _channel_starts(df.channel)
+    stops = np.r_[starts[1:], len(df)]
+    XtX = np.stack([X[start:stop].T @ X[start:stop] for start, stop in zip(starts, stops)])
+    Xty = np.add.reduceat(X * y[:, None], starts)
+
+    penalty = RIDGE * np.eye(X.shape[1])
+    penalty[0, 0] = 0
+    coefficients = np.linalg.solve(XtX + penalty, Xty[:, :, None])[:, :, 0]
+    return pd.DataFrame(coefficients, index=df.channel.iloc[starts].astype(str))
+
+
+def score(df, coefficients):
+    """Expected trips, residuals and anomaly flags for every row of `df`.
+
+    Residuals are on the log scale. The anomaly threshold is scaled by each
+    channel's median absolute residual, so noisy counters aren't flagged
+    more often than steady ones.
+    """
+    rows = coefficients.index.get_indexer(df.channel.astype(str))
+    known = rows >= 0
+
+    prediction = np.full(len(df), np.nan)
+    prediction[known] = np.einsum(
+        "ij,ij->i", design_matrix(df[known]), coefficients.to_numpy()[rows[known]]
+    )
+
+    scored = df[["channel", "ymd", "total_trips"]].reset_index(drop=True)
+    scored["expected_trips"] = np.expm1(prediction)
+    scored["residual"] = np.where(
+        scored.total_trips > 0, np.log1p(scored.total_trips) - prediction, np.nan
+    )
+
+    spread = 1.4826 * scored.residual.abs().groupby(scored.channel, observed=True).transform("median")
+    scored["anomaly"] = (scored.residual.abs() > ANOMALY_THRESHOLD * spread).to_numpy()
+    return scored
+
+
+def expected_counts(df):
+    """Fit every channel's model on `df` and score all of its rows."""
+    return score(df, fit(df))
@@ -0,0 +1,183 @@
+"""Precompute every per-channel artifact in parallel, one worker task per channel.
+
+    python -m cycling.precompute [--workers N]
+
+The results are written as a bundle under data/artifacts/<version>/, where the
+version combines the counter store and weather file versions. The dashboard
+loads a bundle matching its data instead of computing per-channel views on
+the request thread. The dashboard also builds the bundle for every new data
+version before serving it. Only the most recent bundles are kept.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import pandas as pd
+
+from cycling import store
+from cycling.engine import Engine, weekday_mask
+from cycling.weather import load_weather
+
+logger = logging.getLogger("cycling.precompute")
+
+ROOT_DIR = Path(__file__).parent.parent
+ARTIFACT_DIR = ROOT_DIR/'data/artifacts'
+
+# All 127 non-empty selections of the weekday pills
+WEEKDAY_SUBSETS = [
+    days for size in range(1, 8) for days in combinations(range(1, 8), size)
+]
+
+# Weekday profiles and weather days are cheap window lookups in the engine, so
+# only the whole-range results that still need grouping are kept
+FRAMES = ["hourly_profiles", "display_table"]
+
+# Recorded in bundle.json, bump it when FRAMES or their contents change
+FORMAT = 2
+
+_engine = None
+
+
+def _init_worker(store_dir, manifest, weather_file):
+    # Each worker process loads the engine once and reuses it for its channels
+    global _engine
+    _engine = Engine(store_dir, manifest, load_weather(weather_file))
+
+
+def channel_artifacts(engine, channel):
+    """Everything the Individual counters section shows for one channel."""
+    hourly_profiles = pd.concat(
+        [
+            engine.hourly_profile(channel, days).assign(weekdays=weekday_mask(days))
+            for days in WEEKDAY_SUBSETS
+        ],
+        ignore_index=True,
+    )
+    return {
+        "hourly_profiles": hourly_profiles,
+        "display_table": engine.display_table(channel),
+    }
+
+
+def _write_shard(channel, shard_dir):
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in channel_artifacts(_engine, channel).items():
+        df.to_parquet(shard_dir / f"{name}.parquet")
+    return channel
+
+
+def _read_index(bundle_dir):
+    # The bundle's index, or None if it is missing or from an older format
+    bundle_file = Path(bundle_dir) / "bundle.json"
+    if not bundle_file.exists():
+        return None
+    index = json.loads(bundle_file.read_text())
+    return index if index.get("format") == FORMAT else None
+
+
+def build_bundle(store_dir, weather_file, artifact_dir, manifest=None, workers=None, channels=None):
+    """Build the bundle for the current data in a process pool and return its path.
+
+    Shards are written to a per-process temporary directory which is renamed
+    into place once every channel has finished, so a partial bundle is never
+    loaded. Workers are spawned rather than forked, as the dashboard calls
+    this from a background thread.
+    """
+    manifest = manifest or store.read_manifest(store_dir)
+    version = store.data_version(manifest, store.source_version(weather_file))
+    bundle_dir = Path(artifact_dir) / version
+    if _read_index(bundle_dir) is not None:
+        return bundle_dir
+
+    tmp_dir = Path(artifact_dir) / f"{version}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if channels is None:
+        channels = Engine(store_dir, manifest, load_weather(weather_file)).channels
+    shards = {
+        channel: re.sub(r"[^A-Za-z0-9]+", "_", channel).strip("_")
+        for channel in channels
+    }
+
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(store_dir, manifest, weather_file),
+    ) as pool:
+        # Consume the results so a failed shard raises here
+        list(pool.map(_write_shard, shards, [tmp_dir / shard for shard in shards.values()]))
+
+    (tmp_dir / "bundle.json").write_text(
+        json.dumps({"version": version, "format": FORMAT, "channels": shards}, indent=2)
+    )
+    # A bundle left by older code under the same name
+    if bundle_dir.exists() and _read_index(bundle_dir) is None:
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, bundle_dir)
+    except OSError:
+        # Another process finished the same bundle first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    prune(artifact_dir)
+    return bundle_dir
+
+
+def prune(artifact_dir, keep=2):
+    """Delete all but the `keep` most recently built bundles.
+
+    Bundles are read into memory when an engine loads them, so deleting one
+    doesn't affect the processes already serving it.
+    """
+    bundles = sorted(
+        (path for path in Path(artifact_dir).iterdir() if (path / "bundle.json").exists()),
+        key=lambda path: (path / "bundle.json").stat().st_mtime_ns,
+    )
+    for path in bundles[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def load_bundle(bundle_dir):
+    """Per-channel artifacts from a bundle, or None if it hasn't been built."""
+    bundle_dir = Path(bundle_dir)
+    index = _read_index(bundle_dir)
+    if index is None:
+        return None
+
+    artifacts = {}
+    for channel, shard in index["channels"].items():
+        frames = {
+            name: pd.read_parquet(bundle_dir / shard / f"{name}.parquet")
+            for name in FRAMES
+        }
+        # Index the hourly profiles by weekday selection for constant-time lookups
+        frames["hourly_profiles"] = {
+            mask: df.drop(columns="weekdays").reset_index(drop=True)
+            for mask, df in frames["hourly_profiles"].groupby("weekdays")
+        }
+        artifacts[channel] = frames
+    return artifacts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", type=Path, default=ROOT_DIR/'data/store')
+    parser.add_argument("--weather", type=Path, default=ROOT_DIR/'data/weather_data.csv')
+    parser.add_argument("--output", type=Path, default=ARTIFACT_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    bundle_dir = build_bundle(args.store, args.weather, args.output, workers=args.workers)
+    print(f"Artifacts written to {bundle_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Share-of-total profiles (weekday share of weekly count, hourly share of daily count)."""
+import pandas as pd
+
+
+def share_of_total(df, group_cols, value_col="total_trips"):
+    """Each row's share of its group's total.
+
+    The group sums are computed once and broadcast back, so no Python code
+    runs per group.
+    """
+    group_totals = df.groupby(by=group_cols, observed=True)[value_col].transform("sum")
+    return df[value_col] / group_totals
+
+
+def weekly_profile(df_week_weekday, by=["channel"]):
+    """Average percent of the weekly count on each weekday, for every group in `by`."""
+    df_week_sum = df_week_weekday.groupby(
+        by=by + ["y", "week", "weekday"], as_index=False, observed=True
+    ).agg(total_trips=("total_trips", "sum"))
+
+    df_week_sum["weekly_percent"] = share_of_total(df_week_sum, by + ["y", "week"])
+
+    return df_week_sum.groupby(by=by + ["weekday"], as_index=False, observed=True).agg(
+        weekly_mean=("weekly_percent", "mean")
+    )
+
+
+def weekly_shares(df_ymd):
+    """One row per channel and week with each weekday's share of the weekly count.
+
+    `share_<d>` is weekday d's share (0 when it has no count) and `weeks_<d>`
+    is 1 when it has one, so summing both over any run of weeks and dividing
+    gives the same averages as `weekly_profile`. Weeks are ISO weeks within
+    the calendar year, like the `week` column, and rows are sorted by
+    `week_start` and `week_end`, the week's first and last days with data.
+    """
+    df = df_ymd[["channel", "ymd", "y", "weekday", "total_trips"]].assign(
+        week=df_ymd.ymd.dt.isocalendar().week.to_numpy()
+    )
+    keys = ["channel", "y", "week"]
+
+    wide = df.pivot_table(
+        index=keys, columns="weekday", values="total_trips", aggfunc="sum", observed=True
+    ).reindex(columns=range(1, 8))
+    shares = wide.div(wide.sum(axis=1), axis=0)
+    weeks = shares.notna().astype("int64")
+    shares = shares.fillna(0)
+
+    week_days = df.groupby(keys, observed=True).ymd
+    table = pd.concat(
+        [
+            week_days.min().rename("week_start"),
+            week_days.max().rename("week_end"),
+            shares.add_prefix("share_"),
+            weeks.add_prefix("weeks_"),
+        ],
+        axis=1,
+    ).reset_index()
+    table.columns = [str(col) for col in table.columns]
+    return table.sort_values(["channel", "week_start"], ignore_index=True)
+
+
+def hourly_profile(df_hour, weekdays, by=["channel"]):
+    """Average percent of the daily count in each hour and direction, for every group in `by`."""
+    df_hour_sum = (
+        df_hour[df_hour.weekday.isin(weekdays)]
+        .groupby(by=by + ["y", "weekday", "hour", "direction"], as_index=False, observed=True)
+        .agg(total_trips=("total_trips", "sum"))
+    )
+
+    # Don't want to group by direction, want to normalize to total number of trips (both directions). This highlights routes with asymmetric counts.
+    df_hour_sum["hourly_percent"] = share_of_total(df_hour_sum, by + ["weekday"])
+
+    return df_hour_sum.groupby(by=by + ["direction", "hour"], as_index=False, observed=True).agg(
+        hourly_mean=("hourly_percent", "mean")
+    )
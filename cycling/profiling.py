@@ -0,0 +1,55 @@
+"""Opt-in per-stage timings, logged as one JSON line per stage."""
+import json
+import logging
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("cycling.profiling")
+
+
+def configure_logging():
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class Profiler:
+    """Collects wall time and any extra fields (rows, bytes, cache) per stage.
+
+    When disabled, `stage` yields a throwaway dict and records nothing, so
+    callers should only compute expensive fields when `enabled` is set.
+    """
+
+    def __init__(self, enabled=False, maxlen=500):
+        self.enabled = enabled
+        self.records = deque(maxlen=maxlen)
+
+    def add(self, stage, **fields):
+        if not self.enabled:
+            return
+        record = {"stage": stage, **fields}
+        self.records.append(record)
+        logger.info(json.dumps(record, default=str))
+
+    @contextmanager
+    def stage(self, stage, **fields):
+        if not self.enabled:
+            yield {}
+            return
+
+        record = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(stage, wall_ms=round((time.perf_counter() - started) * 1000, 3), **record)
+
+
+def point_count(fig):
+    """Number of data points across all traces of a Plotly figure."""
+    return sum(len(trace.x) for trace in fig.data if trace.x is not None)
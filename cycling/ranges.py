@@ -0,0 +1,142 @@
+"""Date-window queries over channel tables using binary search and prefix sums.
+
+The tables are sorted by channel and then by date, so each channel's rows
+are one contiguous run in date order. A window [start, end] within a channel
+is found with two binary searches. The sum of any additive column over that
+window is then the difference of two prefix sums. Both are O(log n), with no
+filtering or regrouping of rows.
+
+Rolling and year-to-date series search for every row's window at once.
+Each row gets a key combining its channel and day. Keys increase down the
+table, and a window never crosses into another channel's keys.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def channel_runs(channel):
+    """Row positions `(first, stop)` of each channel in a channel-sorted column."""
+    values = channel.astype(str).to_numpy()
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    stops = np.r_[starts[1:], len(values)]
+    return {values[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+
+def window(dates, first, stop, start=None, end=None):
+    """Positions `(lo, hi)` of the rows in `dates[first:stop]` from `start` to `end` (inclusive)."""
+    lo, hi = first, stop
+    if start is not None:
+        lo = first + np.searchsorted(dates[first:stop], np.datetime64(pd.Timestamp(start)), side="left")
+    if end is not None:
+        hi = first + np.searchsorted(dates[first:stop], np.datetime64(pd.Timestamp(end)), side="right")
+    return lo, max(lo, hi)
+
+
+def slice_window(df, date_col, runs, channel=None, start=None, end=None):
+    """Rows of a channel-sorted table within the window.
+
+    `channel` is one channel name, a list of them, or None for all channels.
+    """
+    dates = df[date_col].to_numpy()
+    if isinstance(channel, str):
+        first, stop = runs.get(channel, (0, 0))
+        lo, hi = window(dates, first, stop, start, end)
+        return df.iloc[lo:hi]
+
+    selected = runs.values() if channel is None else [runs[name] for name in channel if name in runs]
+    positions = [
+        np.arange(*window(dates, first, stop, start, end)) for first, stop in selected
+    ]
+    return df.iloc[np.concatenate(positions)] if positions else df.iloc[:0]
+
+
+def _day_number(date):
+    return np.datetime64(pd.Timestamp(date), "D").astype("int64")
+
+
+@dataclass(frozen=True)
+class PrefixSums:
+    """Cumulative sums of `columns` over a channel- and date-sorted table."""
+
+    columns: tuple[str, ...]
+    dates: np.ndarray
+    sums: np.ndarray  # float64, shape (rows + 1, columns), first row zeros
+    runs: dict
+    keys: np.ndarray  # int64, channel number << 32 | days since 1970
+
+    @classmethod
+    def build(cls, df, date_col, columns):
+        values = df[list(columns)].to_numpy(dtype="float64")
+        sums = np.zeros((len(df) + 1, len(columns)))
+        np.cumsum(values, axis=0, out=sums[1:])
+
+        dates = df[date_col].to_numpy()
+        runs = channel_runs(df.channel)
+        lengths = [stop - first for first, stop in runs.values()]
+        keys = (np.repeat(np.arange(len(runs), dtype="int64"), lengths) << 32) + dates.astype(
+            "datetime64[D]"
+        ).astype("int64")
+        return cls(columns=tuple(columns), dates=dates, sums=sums, runs=runs, keys=keys)
+
+    def bounds(self, channel, start=None, end=None):
+        first, stop = self.runs.get(channel, (0, 0))
+        return window(self.dates, first, stop, start, end)
+
+    def total(self, channel, start=None, end=None):
+        """Sum of each column over the window, as a Series."""
+        lo, hi = self.bounds(channel, start, end)
+        return pd.Series(self.sums[hi] - self.sums[lo], index=list(self.columns))
+
+    def totals(self, channels, start=None, end=None):
+        """Sums over the window for several channels at once, shape (channels, columns).
+
+        The window bounds of every channel are found in one vectorized search
+        of the row keys. Unknown channels get zeros.
+        """
+        codes = {name: code for code, name in enumerate(self.runs)}
+        channel_keys = np.array([codes.get(name, -1) for name in channels], dtype="int64") << 32
+        first_day = _day_number(start) if start is not None else 0
+        last_day = _day_number(end) if end is not None else (1 << 32) - 1
+
+        lo = np.searchsorted(self.keys, channel_keys + first_day, side="left")
+        hi = np.searchsorted(self.keys, channel_keys + last_day, side="right")
+        # An end before the start is an empty window, as in `window`
+        hi = np.maximum(lo, hi)
+        return self.sums[hi] - self.sums[lo]
+
+    def count(self, channel, start=None, end=None):
+        lo, hi = self.bounds(channel, start, end)
+        return hi - lo
+
+    def _row_sums(self, column, first_keys, last_keys):
+        # For every row, the column's sum over the rows keyed first..last
+        lo = np.searchsorted(self.keys, first_keys, side="left")
+        hi = np.searchsorted(self.keys, last_keys, side="right")
+        j = self.columns.index(column)
+        return self.sums[hi, j] - self.sums[lo, j]
+
+    def rolling(self, column, days):
+        """Every row's total over the `days` calendar days ending on it."""
+        return self._row_sums(column, self.keys - (days - 1), self.keys)
+
+    def year_to_date(self, column, years_back=0):
+        """Every row's total from January 1 to its day of the year.
+
+        With `years_back`, the total from January 1 to the same date that
+        many years earlier, for year-over-year comparisons. February 29 maps
+        to February 28.
+        """
+        days = self.dates.astype("datetime64[D]")
+        channel_base = self.keys - days.astype("int64")
+
+        earlier_end = (
+            (pd.DatetimeIndex(days) - pd.DateOffset(years=years_back)).to_numpy().astype("datetime64[D]")
+        )
+        earlier_start = earlier_end.astype("datetime64[Y]").astype("datetime64[D]")
+        return self._row_sums(
+            column,
+            channel_base + earlier_start.astype("int64"),
+            channel_base + earlier_end.astype("int64"),
+        )
@@ -0,0 +1,144 @@
+"""Background refresh of the dataset behind the dashboard.
+
+A `Refresher` holds the current `(version, engine)` pair. Its thread checks
+for new data every few minutes, off the request path:
+
+- counter files dropped into the incoming directory are ingested, and
+  unreadable ones set aside in its `failed/` directory
+- a replaced feather file bootstraps a new store
+- a replaced weather file gives a new version
+
+Whenever the version changes the new engine is fully loaded before the pair
+is swapped in with a single assignment. Sessions keep serving the old
+version until then and pick up the new one on their next rerun.
+"""
+import logging
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from cycling import ingest, store
+
+logger = logging.getLogger("cycling.refresh")
+
+INCOMING_SUFFIXES = {".csv", ".parquet", ".feather"}
+
+
+def _move(paths, directory):
+    if not paths:
+        return
+    directory.mkdir(exist_ok=True)
+    for path in paths:
+        path.replace(directory / path.name)
+
+
+def _read_incoming(path):
+    df = ingest.read_counts(path)
+    return store.normalize_schema(df[store.COUNT_COLUMNS])
+
+
+def _incoming_files(incoming_dir):
+    return sorted(
+        path for path in incoming_dir.glob("*")
+        if path.is_file() and path.suffix in INCOMING_SUFFIXES
+    )
+
+
+def ingest_incoming(incoming_dir, store_dir):
+    """Ingest the counter files waiting in `incoming_dir` and move them to `done/`.
+
+    Files that can't be read as counter data are moved to `failed/` instead,
+    so they don't block the files after them. Returns the new manifest, or
+    None if there was nothing to ingest.
+
+    Every server process runs this, so files are listed, read, ingested and
+    moved under the store's writer lock and each file is ingested once.
+    """
+    incoming_dir = Path(incoming_dir)
+    if not _incoming_files(incoming_dir):
+        return None
+    with store.write_lock(store_dir):
+        return _ingest_files(incoming_dir, _incoming_files(incoming_dir), store_dir)
+
+
+def _ingest_files(incoming_dir, files, store_dir):
+    frames, read, failed = [], [], []
+    for path in files:
+        try:
+            frames.append(_read_incoming(path))
+            read.append(path)
+        except Exception:
+            logger.exception("Could not read incoming file %s, moving it to failed/", path.name)
+            failed.append(path)
+    _move(failed, incoming_dir / "failed")
+    if not frames:
+        return None
+
+    df_new = pd.concat(frames, ignore_index=True)
+    manifest = store.ingest(df_new, store_dir)
+    _move(read, incoming_dir / "done")
+
+    logger.info("Ingested %d rows from %d files, store at version %d", len(df_new), len(read), manifest["version"])
+    return manifest
+
+
+class Refresher:
+    """Keeps an engine for the latest version of the data.
+
+    `load(version, manifest)` builds the engine for a version token from
+    `store.data_version`.
+    """
+
+    def __init__(self, source, store_dir, weather_file, load, incoming_dir=None, interval=300):
+        self.source = source
+        self.store_dir = store_dir
+        self.weather_file = weather_file
+        self.load = load
+        self.incoming_dir = incoming_dir
+        self.interval = interval
+        self.current = None
+        self.loads = 0
+        self.last_checked = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Update the store and swap in a new engine if the version changed.
+
+        Returns True if a new version was swapped in.
+        """
+        with self._lock:
+            manifest = store.ensure_store(self.source, self.store_dir)
+            if self.incoming_dir is not None:
+                manifest = ingest_incoming(self.incoming_dir, self.store_dir) or manifest
+            version = store.data_version(manifest, store.source_version(self.weather_file))
+            self.last_checked = pd.Timestamp.now()
+
+            if self.current is not None and self.current[0] == version:
+                return False
+            # Readers keep the previous pair until this assignment
+            self.current = (version, self.load(version, manifest))
+            self.loads += 1
+            logger.info("Serving data version %s", version)
+            return True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as error:
+                # Keep serving the current version and try again next time
+                self.last_error = error
+                logger.exception("Data refresh failed")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cycling-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,74 @@
+import numpy as np
+
+START_DATE = "2020-01-01"
+
+# Every grouping the dashboard plots. Each view is served as a slice of one of
+# these instead of re-aggregating the hourly rows on every rerun.
+ROLLUP_LEVELS = {
+    "ymd": ["ymd", "ym", "y", "m", "weekday"],
+    "yw": ["y", "week"],
+    "ym": ["ym", "m", "y"],
+    "y": ["y"],
+    "channel_ymd": ["channel", "ymd", "ym", "y", "m", "weekday"],
+    "channel_yw": ["channel", "y", "week"],
+    "channel_ym": ["channel", "ym", "m", "y"],
+    "channel_y": ["channel", "y"],
+    "direction_weekday": ["channel", "direction", "weekday"],
+    "direction_hour": ["channel", "direction", "hour"],
+    # Finest levels behind the per-channel weekday and hour-of-day profiles
+    "channel_week_weekday": ["channel", "ym", "y", "week", "weekday"],
+    "channel_hour": ["channel", "ym", "y", "weekday", "hour", "direction"],
+}
+
+
+def trip_counts(df, group_cols, value_col="trips"):
+    return df.groupby(by=group_cols, as_index=False, observed=True).agg(
+        total_trips=(value_col, "sum")
+    ).astype({"total_trips": "int64"})
+
+
+def partial_keys(level):
+    cols = ROLLUP_LEVELS[level]
+    return cols if "ym" in cols else cols + ["ym"]
+
+
+def build_partials(df):
+    """Aggregate hourly rows to every level, keeping the month partition key.
+
+    Sums are additive, so partials for separate months can be computed
+    independently and combined later with `collapse_partials`.
+    """
+    return {level: trip_counts(df, partial_keys(level)) for level in ROLLUP_LEVELS}
+
+
+def collapse_partials(partials):
+    return {
+        level: trip_counts(partials[level], cols, value_col="total_trips")
+        for level, cols in ROLLUP_LEVELS.items()
+    }
+
+
+
+def index_by_channel(cube):
+    """Row ranges of each channel in every channel-level table of `cube`.
+
+    Each channel's rows form one contiguous slice (tables that aren't grouped
+    by channel are sorted in place first), so selecting a channel is a dict
+    lookup returning a slice of the table rather than a copy.
+    """
+    index = {}
+    for level, df in cube.items():
+        if "channel" not in df.columns:
+            continue
+
+        starts = np.flatnonzero(df.channel.ne(df.channel.shift()).to_numpy())
+        if len(starts) != df.channel.nunique():
+            df = cube[level] = df.sort_values(by="channel", kind="stable").reset_index(drop=True)
+            starts = np.flatnonzero(df.channel.ne(df.channel.shift()).to_numpy())
+
+        stops = np.append(starts[1:], len(df))
+        index[level] = {
+            df.channel.iat[start]: df.iloc[start:stop]
+            for start, stop in zip(starts, stops)
+        }
+    return index
@@ -0,0 +1,85 @@
+"""Read-only, memory-mapped Arrow IPC snapshots of the engine's tables.
+
+Every server process maps the same uncompressed IPC files, so the operating
+system keeps one copy of the pages however many processes and sessions read
+them. Numeric and date columns come back as pandas columns backed directly
+by the mapping. Plain NumPy arrays are kept alongside as `.npy` files and
+mapped read-only the same way.
+"""
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Written to the `_complete` marker. Bump it when the engine's tables change
+# shape so snapshots written by older code are rebuilt.
+FORMAT = "6"
+
+
+def exists(snapshot_dir):
+    marker = Path(snapshot_dir) / "_complete"
+    return marker.exists() and marker.read_text() == FORMAT
+
+
+def write_frames(frames, snapshot_dir, arrays=None):
+    """Write each DataFrame in `frames` to `<name>.arrow` in `snapshot_dir`,
+    and each array in `arrays` to `<name>.npy`.
+
+    Files go to a per-process temporary directory that is renamed into place,
+    so concurrent writers can't leave a half-written snapshot behind.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    tmp_dir = snapshot_dir.with_name(f"{snapshot_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    for name, df in frames.items():
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(str(tmp_dir / f"{name}.arrow"), "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    for name, array in (arrays or {}).items():
+        np.save(tmp_dir / f"{name}.npy", array)
+    (tmp_dir / "_complete").write_text(FORMAT)
+
+    # A snapshot left by older code under the same name
+    if snapshot_dir.exists() and not exists(snapshot_dir):
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, snapshot_dir)
+    except OSError:
+        # Another process finished the same snapshot first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def map_frames(snapshot_dir):
+    frames = {}
+    for path in sorted(Path(snapshot_dir).glob("*.arrow")):
+        table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        # One block per column lets pandas wrap the mapped buffers without copying
+        frames[path.stem] = table.to_pandas(split_blocks=True)
+    return frames
+
+
+def map_arrays(snapshot_dir):
+    return {
+        path.stem: np.load(path, mmap_mode="r")
+        for path in sorted(Path(snapshot_dir).glob("*.npy"))
+    }
+
+
+def prune(snapshot_root, keep=2):
+    """Delete all but the `keep` most recently written snapshots.
+
+    Processes still mapping a deleted snapshot keep working, the pages stay
+    valid until they are unmapped.
+    """
+    snapshots = sorted(
+        (path for path in Path(snapshot_root).iterdir() if (path / "_complete").exists()),
+        key=lambda path: (path / "_complete").stat().st_mtime_ns,
+    )
+    for path in snapshots[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,375 @@
+"""Date-partitioned store of the hourly counter data and its rollups.
+
+Layout under the store directory::
+
+    manifest.json                          current version, points at everything below
+    counts/ym=YYYY-MM/part-NNNNNN.parquet  hourly rows, one file per month
+    rollups/<level>-NNNNNN.parquet         per-month partial rollups for each level
+
+Files are never rewritten in place. Every ingest writes new files tagged with
+the next version number and then swaps `manifest.json`, so readers always see
+a complete version. Writers hold an exclusive lock on `.lock` in the store
+directory, so several server processes can share one store.
+"""
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from cycling import rollups
+
+COUNT_COLUMNS = ["channel", "direction", "ymd", "ym", "y", "m", "week", "weekday", "hour", "trips"]
+ROW_KEYS = ["channel", "direction", "ymd", "hour"]
+
+# Compact dtypes for the counter columns. `ymd` and `ym` become real dates
+# (ym is the first of the month) instead of strings.
+SCHEMA = {
+    "channel": "category",
+    "direction": "category",
+    "y": "int16",
+    "m": "int8",
+    "week": "int8",
+    "weekday": "int8",
+    "hour": "int8",
+    "trips": "int32",
+}
+DATE_FORMATS = {"ymd": "%Y-%m-%d", "ym": "%Y-%m"}
+
+# Rows are sorted by channel before writing, so small row groups let channel
+# filters skip most of a month using the parquet min/max statistics.
+ROW_GROUP_SIZE = 8192
+
+
+def source_version(path):
+    """Cheap fingerprint of a data file, changes whenever the file is replaced."""
+    stat = Path(path).stat()
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def store_version(manifest):
+    """Token identifying one version of the counter store.
+
+    Version numbers restart when a store is rebuilt from scratch, so the
+    token also carries the id drawn when the store was bootstrapped.
+    """
+    return f"{manifest.get('store_id') or manifest['source']}-{manifest['version']}"
+
+
+def data_version(manifest, weather_version):
+    """Token identifying one version of the counter store together with the weather file."""
+    return f"{store_version(manifest)}-{weather_version}"
+
+
+# Store directories whose writer lock this thread holds, so nested writes
+# (e.g. `ingest` inside a caller's `write_lock`) don't wait on themselves
+_held_locks = threading.local()
+
+
+def _lock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:
+        # Windows
+        import msvcrt
+
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # Gave up after its own retries, keep waiting
+                continue
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+def _unlock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def write_lock(store_dir):
+    """Hold the store's writer lock, waiting for any other process or thread holding it.
+
+    Reentrant within a thread.
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    key = str(store_dir.resolve())
+    held = _held_locks.__dict__.setdefault("dirs", set())
+    if key in held:
+        yield
+        return
+
+    with open(store_dir / ".lock", "w") as lock_file:
+        _lock_file(lock_file)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            _unlock_file(lock_file)
+
+
+def read_manifest(store_dir):
+    manifest_file = Path(store_dir) / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    return json.loads(manifest_file.read_text())
+
+
+def _write_manifest(store_dir, manifest):
+    store_dir = Path(store_dir)
+    tmp_file = store_dir / "manifest.json.tmp"
+    tmp_file.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_file, store_dir / "manifest.json")
+
+
+def _prune(store_dir, *manifests):
+    # Keep files referenced by the new manifest and the one it replaced, so
+    # readers that loaded the previous version can still finish.
+    store_dir = Path(store_dir)
+    keep = set()
+    for manifest in manifests:
+        if manifest:
+            keep.update(manifest["partitions"].values())
+            keep.update(manifest["rollups"].values())
+
+    for path in store_dir.glob("**/*.parquet"):
+        if path.relative_to(store_dir).as_posix() not in keep:
+            path.unlink()
+
+
+def normalize_schema(df):
+    """Convert whichever counter columns `df` has to their compact dtypes."""
+    df = df.astype({col: dtype for col, dtype in SCHEMA.items() if col in df.columns})
+    for col, date_format in DATE_FORMATS.items():
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=date_format)
+    return df
+
+
+def _month_key(ym):
+    return f"{ym:%Y-%m}"
+
+
+def _write_partition(store_dir, ym, df, version):
+    relative = f"counts/ym={ym}/part-{version:06d}.parquet"
+    path = Path(store_dir) / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.sort_values(by=ROW_KEYS).to_parquet(
+        path, index=False, row_group_size=ROW_GROUP_SIZE
+    )
+    return relative
+
+
+def _write_rollups(store_dir, partials, version):
+    (Path(store_dir) / "rollups").mkdir(parents=True, exist_ok=True)
+    files = {}
+    for level, df in partials.items():
+        files[level] = f"rollups/{level}-{version:06d}.parquet"
+        df.to_parquet(Path(store_dir) / files[level], index=False)
+    return files
+
+
+def bootstrap(source, store_dir):
+    """Rebuild the whole store from the cleaned feather file.
+
+    Callers must hold `write_lock`, as `ensure_store` does.
+    """
+    previous = read_manifest(store_dir)
+    version = previous["version"] + 1 if previous else 1
+
+    df = (
+        ds.dataset(source, format="feather")
+        .to_table(
+            columns=COUNT_COLUMNS, filter=ds.field("ymd") >= rollups.START_DATE
+        )
+        .to_pandas()
+        .pipe(normalize_schema)
+    )
+
+    partitions = {
+        _month_key(ym): _write_partition(store_dir, _month_key(ym), df_month, version)
+        for ym, df_month in df.groupby("ym")
+    }
+    manifest = {
+        "version": version,
+        "store_id": uuid.uuid4().hex[:12],
+        "source": source_version(source),
+        "partitions": partitions,
+        "rollups": _write_rollups(store_dir, rollups.build_partials(df), version),
+    }
+    _write_manifest(store_dir, manifest)
+    _prune(store_dir, manifest, previous)
+    return manifest
+
+
+def ingest(df_new, store_dir):
+    """Append new hourly rows, rewriting only the months they touch.
+
+    Rows that repeat an existing (channel, direction, ymd, hour) replace the
+    stored value. Only the partial rollups of the affected months are
+    recomputed from hourly rows; the other months' partials are carried over.
+    """
+    with write_lock(store_dir):
+        return _ingest(df_new, store_dir)
+
+
+def _ingest(df_new, store_dir):
+    previous = read_manifest(store_dir)
+    if previous is None:
+        raise FileNotFoundError(f"No counter store found in {store_dir}")
+    version = previous["version"] + 1
+
+    df_new = (
+        normalize_schema(df_new[COUNT_COLUMNS])
+        .query(f"ymd >= '{rollups.START_DATE}'")
+        .drop_duplicates(subset=ROW_KEYS, keep="last")
+    )
+    store_dir = Path(store_dir)
+
+    partitions = dict(previous["partitions"])
+    affected = []
+    for ym, df_month in df_new.groupby("ym"):
+        ym = _month_key(ym)
+        if ym in partitions:
+            df_month = (
+                pd.concat(
+                    [pd.read_parquet(store_dir / partitions[ym]), df_month],
+                    ignore_index=True,
+                )
+                .drop_duplicates(subset=ROW_KEYS, keep="last")
+                .pipe(normalize_schema)
+            )
+        partitions[ym] = _write_partition(store_dir, ym, df_month, version)
+        affected.append(df_month)
+
+    if not affected:
+        return previous
+
+    df_affected = normalize_schema(pd.concat(affected, ignore_index=True))
+    affected_months = df_affected.ym.unique()
+    partials_new = rollups.build_partials(df_affected)
+
+    partials = {}
+    for level, df_partial in partials_new.items():
+        df_old = normalize_schema(
+            pd.read_parquet(store_dir / previous["rollups"][level])
+        )
+        partials[level] = normalize_schema(
+            pd.concat(
+                [df_old[~df_old.ym.isin(affected_months)], df_partial],
+                ignore_index=True,
+            )
+        )
+
+    manifest = {
+        "version": version,
+        "store_id": previous.get("store_id"),
+        "source": previous["source"],
+        "partitions": partitions,
+        "rollups": _write_rollups(store_dir, partials, version),
+    }
+    _write_manifest(store_dir, manifest)
+    _prune(store_dir, manifest, previous)
+    return manifest
+
+
+def _filter_expression(start, end, channels):
+    expression = None
+    for condition in [
+        ds.field("ymd") >= start.to_pydatetime() if start is not None else None,
+        ds.field("ymd") <= end.to_pydatetime() if end is not None else None,
+        ds.field("channel").isin(channels) if channels is not None else None,
+    ]:
+        if condition is not None:
+            expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _partition_files(store_dir, manifest, start, end):
+    return [
+        str(Path(store_dir) / path)
+        for ym, path in sorted(manifest["partitions"].items())
+        if (start is None or ym >= _month_key(start))
+        and (end is None or ym <= _month_key(end))
+    ]
+
+
+def load_counts(store_dir, manifest, start=None, end=None, channels=None, columns=None):
+    """Read hourly rows from the store.
+
+    The date range (inclusive, anything `pd.Timestamp` accepts) selects which monthly
+    partitions are opened at all. Within them, the date and channel filters
+    are pushed down to the parquet reader, which skips row groups using their
+    statistics, and only `columns` are decoded.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    files = _partition_files(store_dir, manifest, start, end)
+    if not files:
+        return normalize_schema(pd.DataFrame(columns=columns or COUNT_COLUMNS))
+
+    dataset = ds.dataset(files, format="parquet")
+    table = dataset.to_table(
+        columns=columns, filter=_filter_expression(start, end, channels)
+    )
+    return normalize_schema(table.to_pandas())
+
+
+def scan_counts(store_dir, manifest, start=None, end=None, channels=None, batch_size=65536):
+    """Hourly rows from the store as a stream of Arrow record batches.
+
+    Takes the same filters as `load_counts`, but only holds one batch in
+    memory at a time.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    files = _partition_files(store_dir, manifest, start, end)
+    if not files:
+        return
+    dataset = ds.dataset(files, format="parquet")
+    yield from dataset.to_batches(
+        columns=COUNT_COLUMNS,
+        filter=_filter_expression(start, end, channels),
+        batch_size=batch_size,
+    )
+
+
+def ensure_store(source, store_dir):
+    """Return the current manifest, bootstrapping if the feather file was replaced."""
+    manifest = read_manifest(store_dir)
+    if manifest is not None and manifest["source"] == source_version(source):
+        return manifest
+
+    with write_lock(store_dir):
+        # Another process may have bootstrapped while this one waited
+        manifest = read_manifest(store_dir)
+        if manifest is None or manifest["source"] != source_version(source):
+            manifest = bootstrap(source, store_dir)
+        return manifest
+
+
+def load_rollups(store_dir, manifest):
+    store_dir = Path(store_dir)
+    partials = {
+        level: normalize_schema(pd.read_parquet(store_dir / path))
+        for level, path in manifest["rollups"].items()
+    }
+    return rollups.collapse_partials(partials)
@@ -0,0 +1,128 @@
+"""Daily weather, cached as typed columnar data indexed by date.
+
+The CSV is parsed once per version. The result, with a sorted `ymd`
+DatetimeIndex, compact dtypes and a `conditions` bitmap of each day's
+weather, is written to a parquet file beside it and read back directly
+until the CSV changes.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cycling import rollups, store
+
+SCHEMA = {
+    "year": "int16",
+    "month": "int8",
+    "day": "int8",
+}
+
+# Bits of the `conditions` column. A day can have several, e.g. RAIN | MILD.
+DRY = 1 << 0             # no rain, snow or precipitation, and no snow on the ground
+RAIN = 1 << 1            # any rain, or rain not recorded
+SNOW_ON_GROUND = 1 << 2
+FREEZING = 1 << 3        # mean temperature below 0
+COLD = 1 << 4            # 0 to 10
+MILD = 1 << 5            # 10 to 20
+WARM = 1 << 6            # 20 and above
+ABOVE_FREEZING = COLD | MILD | WARM
+
+TEMP_BANDS = {FREEZING: (-np.inf, 0), COLD: (0, 10), MILD: (10, 20), WARM: (20, np.inf)}
+
+# Parquet metadata key holding the `store.source_version` of the parsed CSV,
+# prefixed with FORMAT. Bump FORMAT when the parsed columns change.
+VERSION_KEY = b"cycling.source_version"
+FORMAT = 2
+
+
+def cache_path(path):
+    return Path(path).with_suffix(".parquet")
+
+
+def _cached_version(cache_file):
+    try:
+        metadata = pq.read_schema(cache_file).metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return metadata.get(VERSION_KEY, b"").decode() or None
+
+
+def condition_flags(df):
+    """The `conditions` bitmap for each day in `df`.
+
+    Comparisons with missing values are false, except that a missing
+    `total_rain` counts as RAIN.
+    """
+    flags = np.zeros(len(df), dtype="uint8")
+    dry = (
+        df.total_rain.eq(0)
+        & df.total_snow.eq(0)
+        & df.total_precip.eq(0)
+        & df.snow_on_ground.eq(0)
+    )
+    flags[dry.to_numpy()] |= DRY
+    flags[df.total_rain.ne(0).to_numpy()] |= RAIN
+    flags[df.snow_on_ground.gt(0).to_numpy()] |= SNOW_ON_GROUND
+
+    mean_temp = df.mean_temp.to_numpy()
+    for flag, (low, high) in TEMP_BANDS.items():
+        flags[(mean_temp >= low) & (mean_temp < high)] |= flag
+    return flags
+
+
+def select(flags, all_of=0, any_of=0):
+    """Boolean mask of the days whose `conditions` have every bit in `all_of`
+    and, if given, at least one bit in `any_of`."""
+    mask = (flags & all_of) == all_of
+    if any_of:
+        mask &= (flags & any_of) != 0
+    return mask
+
+
+def parse_csv(path):
+    df = pd.read_csv(path, dtype=SCHEMA)
+    df["ymd"] = pd.to_datetime(df.ymd, format="%Y-%m-%d")
+
+    df = df[df.ymd >= pd.Timestamp(rollups.START_DATE)]
+    df = df.set_index("ymd").sort_index()
+    df["conditions"] = condition_flags(df)
+    return df
+
+
+def load_weather(path):
+    """Weather since `rollups.START_DATE`, indexed by day."""
+    cache_file = cache_path(path)
+    version = f"{FORMAT}-{store.source_version(path)}"
+    if _cached_version(cache_file) == version:
+        return pd.read_parquet(cache_file)
+
+    df = parse_csv(path)
+
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, VERSION_KEY: version.encode()}
+    )
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_file)
+    os.replace(tmp_file, cache_file)
+    return df
+
+
+def join(df, weather, on="ymd"):
+    """Add the weather columns to each row of `df`, dropping days without weather.
+
+    Rows are matched by looking up each date in the weather index, which
+    keeps the row order of `df` like an inner `pd.merge` on `on` would.
+    """
+    positions = weather.index.get_indexer(df[on])
+    found = positions >= 0
+    if not found.all():
+        df = df[found]
+        positions = positions[found]
+
+    matched = weather.iloc[positions].reset_index(drop=True)
+    return pd.concat([df.reset_index(drop=True), matched], axis=1)
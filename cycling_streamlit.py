@@ -1,71 +1,136 @@
 import streamlit as st
+import os
 import pandas as pd
-import plotly.express as px
+import plotly.io as pio
+from functools import partial
 from pathlib import Path
+from time import perf_counter
 
-st.set_page_config(layout="wide")
+from cycling import export, figures, precompute, snapshot
+from cycling.cache import LRUCache
+from cycling.engine import Engine
+from cycling.weather import load_weather
+from cycling.profiling import Profiler, configure_logging, point_count
+from cycling.refresh import Refresher
 
-@st.cache_data
-def get_data():
+st.set_page_config(layout="wide")
 
-    DATA_FILENAME = Path(__file__).parent/'data/clean_cycle_data.feather'
-    df = pd.read_feather(DATA_FILENAME)
+# Top-level code only runs on full reruns, widget changes inside a fragment
+# rerun just that fragment
+st.session_state.full_runs = st.session_state.get("full_runs", 0) + 1
+load_started = perf_counter()
+
+# Opt-in with ?profile=1 or CYCLING_PROFILE=1. Stages are logged as JSON lines
+# and summarized in the sidebar. The profiler lives in the session so records
+# from fragment reruns are kept for the next full rerun.
+profiler = st.session_state.setdefault("profiler", Profiler())
+profiler.enabled = (
+    st.query_params.get("profile") == "1" or os.environ.get("CYCLING_PROFILE") == "1"
+)
+if profiler.enabled:
+    configure_logging()
 
-    df = df.query("ymd >= '2020-01-01'")
-    return df
+DATA_FILENAME = Path(__file__).parent/'data/clean_cycle_data.feather'
+WEATHER_FILENAME = Path(__file__).parent/'data/weather_data.csv'
+STORE_DIR = Path(__file__).parent/'data/store'
+SNAPSHOT_DIR = Path(__file__).parent/'data/snapshots'
+EXPORT_DIR = Path(__file__).parent/'data/exports'
+INCOMING_DIR = Path(__file__).parent/'data/incoming'
 
 
-@st.cache_data
-def get_weather_data():
-    
-    DATA_FILENAME = Path(__file__).parent/'data/weather_data.csv'
-    df = pd.read_csv(DATA_FILENAME)
+def load_engine(version, manifest):
 
-    df = df.query("ymd >= '2020-01-01'").sort_values(by=["ymd"])
-    return df
+    # Runs once per data version, in the refresher's thread after startup.
+    # One engine per process shared by every session. Its tables are mapped
+    # from a snapshot on disk, which other server processes map too.
+    engine = Engine.mapped(
+        STORE_DIR, manifest, load_weather(WEATHER_FILENAME), SNAPSHOT_DIR / version
+    )
+    snapshot.prune(SNAPSHOT_DIR)
 
+    # Per-channel views over the full range, built before this version is
+    # served unless `python -m cycling.precompute` or another process did already
+    try:
+        bundle_dir = precompute.build_bundle(
+            STORE_DIR, WEATHER_FILENAME, precompute.ARTIFACT_DIR, manifest, channels=engine.channels
+        )
+        engine.load_artifacts(precompute.load_bundle(bundle_dir))
+    except Exception:
+        precompute.logger.exception(
+            "Could not build the precomputed bundle for data version %s, per-channel "
+            "views are computed on request",
+            version,
+        )
+    return engine
+
+
+@st.cache_resource
+def get_refresher():
+    # The first visitor after a server start waits for the initial load. New
+    # data after that is picked up in the background and swapped in when ready.
+    refresher = Refresher(
+        DATA_FILENAME,
+        STORE_DIR,
+        WEATHER_FILENAME,
+        load=load_engine,
+        incoming_dir=INCOMING_DIR,
+        interval=int(os.environ.get("CYCLING_REFRESH_SECONDS", 300)),
+    )
+    refresher.refresh()
+    refresher.start()
+    return refresher
 
-@st.cache_data
-def convert_for_download(df):
-    return df.to_csv(index=False).encode("utf-8")
 
+@st.cache_resource
+def get_hourly_profile_cache():
+    # 127 weekday subsets per channel, shared by every session
+    return LRUCache(maxsize=1024)
 
-@st.cache_data
-def trip_counts(df, group_cols=[]):
 
-    return df.groupby(by=group_cols, as_index=False).agg(total_trips=("trips", "sum"))
+@st.cache_resource
+def get_figure_cache():
+    # Built figures keyed by the inputs each chart depends on. A hit skips
+    # Plotly Express construction and layout validation entirely.
+    return LRUCache(maxsize=512)
 
 
-df = get_data()
-df_weather = get_weather_data()
+with profiler.stage("load.engine") as record:
+    # Read once so the version and engine always belong together. Every cached
+    # artifact derived from the data is keyed on `data_version`.
+    data_version, engine = get_refresher().current
+    manifest = engine.manifest
+    if profiler.enabled:
+        record["rows"] = sum(len(df) for df in engine.cube.values())
 
-# df["y"] = df["y"].astype("str")
+st.session_state.section_ms = {"load": (perf_counter() - load_started) * 1000}
 
-df_ymd = trip_counts(df, ["ymd", "ym", "y", "m", "weekday"])
-df_yw = trip_counts(df, ["y", "week"])
-df_ym = trip_counts(df, ["ym", "m", "y"])
-df_y = trip_counts(df, ["y"])
+###### Define constants
+# Date range of data
+min_date, max_date = engine.date_range
 
-df_combined_ymd = pd.merge(df_ymd, df_weather, on="ymd")
+# Channel names
+channels = engine.channels
 
-df_channel_ymd = trip_counts(df, ["channel", "ymd", "ym", "y", "m", "weekday"])
-df_channel_yw = trip_counts(df, ["channel", "y", "week"])
-df_channel_ym = trip_counts(df, ["channel", "ym", "m", "y"])
-df_channel_y = trip_counts(df, ["channel", "y"])
+with st.sidebar:
 
-df_channel_combined = pd.merge(df_channel_ymd, df_weather, on="ymd")
+    st.title("Historical Halifax Cycling Dashboard")
 
-df_direction_ymd = trip_counts(df, ["channel", "direction", "weekday"])
-df_direction_h = trip_counts(df, ["channel", "direction", "hour"])
+    st.markdown(
+        "Created by [John Niven](https://bsky.app/profile/johnniven.bsky.social)"
+    )
 
-###### Define constants
-# Date range of data
-min_date = df.ymd.min()
-max_date = df.ymd.max()
+    st.subheader(f"Data updated {max_date:%Y-%m-%d}")
 
-# Channel names
-channels = sorted(df.channel.unique().tolist())
-channel_color_dict = dict(zip(channels,px.colors.qualitative.Alphabet[0:len(channels)]))
+    # Date window for every chart below the network history. Sections look up
+    # their rows in it by binary search instead of filtering whole tables.
+    date_window = st.slider(
+        "Date range",
+        min_value=min_date.date(),
+        max_value=max_date.date(),
+        value=(min_date.date(), max_date.date()),
+        format="YYYY-MM-DD",
+    )
+window_start, window_end = (pd.Timestamp(date) for date in date_window)
 
 ####### Plots
 # st.subheader(f"Overall network counts")
@@ -297,428 +362,213 @@ channel_color_dict = dict(zip(channels,px.colors.qualitative.Alphabet[0:len(chan
 # #     )
 
 ##########################################################################################
-st.divider()
-
-st.subheader(f"Network history")
+# Figures
+# Each chart is built from the inputs passed to its figures.build_* function and
+# cached on them, so a rerun that doesn't change those inputs reuses the built figure.
 
-fig_histories = px.scatter(
-    df_channel_ymd.query("total_trips>0"), x="ymd", y="channel", color="channel",color_discrete_map=channel_color_dict
-)
+option_map = {
+    1: "Monday",
+    2: "Tuesday",
+    3: "Wednesday",
+    4: "Thursday",
+    5: "Friday",
+    6: "Saturday",
+    7: "Sunday",
+}
 
-# Axis formatting
-fig_histories.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text = "Date",
-                font=dict(
-                    size = 20
-                )
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-            tickformat="%b\n%Y",
-        ),
-        yaxis=dict(
-            title=dict(
-                text = "Counter",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-    ),
-    showlegend=True,
-    legend=dict(
-        title=dict(text="Route", font_size=20),
-        yanchor="top",
-        y=1,
-        xanchor="left",
-        x=1,
-        font=dict(size=16),
-    ),
-    autosize=False,
-    width=1000,
-    height=600,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
-    )
-)
 
-config = {
-    "toImageButtonOptions": {
-        "format": "png",
-        "filename": "counter_histories",
-        "scale": 5,
-    }
-}
+def cached_figure(name, build, *inputs):
+    key = (name, data_version) + inputs
+    with profiler.stage(f"figure.{name}") as record:
+        if profiler.enabled:
+            record["cache"] = "hit" if key in get_figure_cache() else "miss"
+        fig = get_figure_cache().get_or_compute(key, lambda: build(engine, *inputs))
+        if profiler.enabled:
+            record["rows"] = point_count(fig)
+    return fig
 
-col1, col2, col3 = st.columns([0.1,0.8,0.1])
 
-with col2:
-    st.plotly_chart(
-        fig_histories, 
-        on_select="ignore", 
-        use_container_width=True, 
-        config=config
-    )
+def plotly_chart(name, fig, **kwargs):
+    with profiler.stage(f"render.{name}") as record:
+        st.plotly_chart(fig, **kwargs)
+        if profiler.enabled:
+            # Same serialization st.plotly_chart sends to the browser
+            record["bytes"] = len(pio.to_json(fig, validate=False))
 
 
 ##########################################################################################
+# Sections
+# Sections with widgets are fragments, so changing a widget only reruns the
+# section that reads it.
+
+def rerun_readout(name, started, nested=False):
+    # A fragment that already ran during the current full run is being rerun on
+    # its own, so report how much of a full rerun that avoided.
+    elapsed_ms = (perf_counter() - started) * 1000
+    if not nested:
+        st.session_state.section_ms[name] = elapsed_ms
+    profiler.add(f"section.{name}", wall_ms=round(elapsed_ms, 3))
+
+    last_full_run = st.session_state.get(f"last_full_run_{name}")
+    st.session_state[f"last_full_run_{name}"] = st.session_state.full_runs
+
+    if last_full_run == st.session_state.full_runs:
+        full_ms = sum(st.session_state.section_ms.values())
+        skipped_ms = max(full_ms - elapsed_ms, 0)
+        st.caption(
+            f"Reran this section in {elapsed_ms:.0f} ms, skipping {skipped_ms:.0f} ms "
+            f"({skipped_ms / full_ms:.0%}) of a full rerun"
+        )
 
-st.divider()
 
-st.subheader(f"Route counts")
+def history_section():
+    started = perf_counter()
 
-date_format = st.radio(
-    "Select date group format",
-    ["Daily", "Monthly", "Yearly"],
-    key="channel_totals",
-    index=1,
-    horizontal=True,
-)
+    st.divider()
 
-if date_format == "Daily":
-    df_plot = df_channel_ymd
-    x_var = "ymd"
-    x_label = "Date"
-elif date_format == "Weekly":
-    df_plot = df_channel_yw
-    x_var = "week"
-    x_label = "Week Number"
-elif date_format == "Monthly":
-    df_plot = df_channel_ym
-    x_var = "ym"
-    x_label = "Month"
-else:
-    df_plot = df_channel_y
-    x_var = "y"
-    x_label = "Year"
-
-fig_total_counts_channel = px.line(
-    df_plot,
-    x=x_var,
-    y="total_trips",
-    color="channel",
-    color_discrete_map=channel_color_dict
-)
+    st.subheader(f"Network history")
 
-# Axis formatting
-fig_total_counts_channel.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text =x_label,
-                font=dict(
-                    size = 20
-                )
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-        ),
-        yaxis=dict(
-            title=dict(
-                text = f"Total {date_format.lower()} count",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-    ),
-    autosize=False,
-    width=1000,
-    height=600,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
-    )
-)
-
-config = {
-    "toImageButtonOptions": {
-        "format": "png",
-        "filename": "all_route_totals",
-        "scale": 5,
+    config = {
+        "toImageButtonOptions": {
+            "format": "png",
+            "filename": "counter_histories",
+            "scale": 5,
+        }
     }
-}
 
-col1, col2, col3 = st.columns([0.1,0.8,0.1])
+    col1, col2, col3 = st.columns([0.1,0.8,0.1])
 
-with col2:
-    st.plotly_chart(
-        fig_total_counts_channel,
-        on_select="ignore",
-        use_container_width=True,
-        config=config,
-    )
+    with col2:
+        plotly_chart(
+            "histories",
+            cached_figure("histories", figures.build_histories), 
+            on_select="ignore", 
+            use_container_width=True, 
+            config=config
+        )
 
-st.divider()
-######### Channel plot
-st.header(f"Individual counters")
+    rerun_readout("history", started)
 
-col1, col2, col3 = st.columns(3)
 
-with col1:
-    selected_channel = st.selectbox("Select a route", channels, index=1)
+@st.fragment
+def route_counts_section():
+    started = perf_counter()
 
-    st.subheader("Counter history")
-    date_format_channel = st.radio(
+    st.divider()
+
+    st.subheader(f"Route counts")
+
+    date_format = st.radio(
         "Select date group format",
-        ["Daily ", "Monthly ", "Yearly "],
+        ["Daily", "Monthly", "Yearly"] + list(figures.CUMULATIVE_MEASURES),
+        key="channel_totals",
         index=1,
         horizontal=True,
     )
 
-if date_format_channel == "Daily ":
-    df_channel = df_channel_ymd.query("channel == @selected_channel")
-    x_var = "ymd"
-elif date_format_channel == "Monthly ":
-    df_channel = df_channel_ym.query("channel == @selected_channel")
-    x_var = "ym"
-else:
-    df_channel = df_channel_y.query("channel == @selected_channel")
-    x_var = "y"
-
-fig_channel_counts = px.bar(
-    df_channel,
-    x=x_var,
-    y="total_trips",
-    hover_data=x_var,
-)
-
-if date_format_channel == "Yearly ":
-
-    # Axis formatting
-    fig_channel_counts.update_layout(
-        dict(
-            xaxis=dict(
-                title=dict(
-                    text = "Date",
-                    font=dict(
-                        size = 20
-                    )
-                ),
-                tickfont = dict(
-                    size = 20
-                ),
-                tickformat="array",
-                tickvals=df_channel.y.unique(),
-                ticktext=df_channel.y.unique(),
-            ),
-            autosize=False,
-            width=1000,
-            height=600,
-            margin=dict(l=0, r=0, t=0, b=0),
-            font_color="black",
-        )
-    )
+    if date_format in figures.CUMULATIVE_MEASURES:
+        build_route_counts = figures.build_cumulative_counts
+    else:
+        build_route_counts = figures.build_total_counts_channel
+
+    config = {
+        "toImageButtonOptions": {
+            "format": "png",
+            "filename": "all_route_totals",
+            "scale": 5,
+        }
+    }
 
-else:
-    fig_channel_counts.update_layout(
-        dict(
-            xaxis=dict(
-                title=dict(
-                    text = "Date",
-                    font=dict(
-                        size = 20
-                    )
-                ),
-                tickfont = dict(
-                    size = 20
-                ),
-                tickformat="%b\n%Y",
+    col1, col2, col3 = st.columns([0.1,0.8,0.1])
+
+    with col2:
+        plotly_chart(
+            "total_counts_channel",
+            cached_figure(
+                "total_counts_channel",
+                build_route_counts,
+                date_format,
+                window_start,
+                window_end,
             ),
-            autosize=False,
-            width=1000,
-            height=600,
-            margin=dict(l=0, r=0, t=0, b=0),
-            font_color="black",
-        )
-    )
-
-fig_channel_counts.update_layout(
-        dict(
-            yaxis=dict(
-                title=dict(
-                    text = f"Total {date_format.lower()} count",
-                    font= dict(
-                        size = 20
-                    ),
-                ),
-                tickfont = dict(
-                    size = 20
-                ),
-        ),
-        autosize=False,
-        width=500,
-        height=400,
-        margin=dict(l=0, r=0, t=0, b=0),
-        font_color="black",
+            on_select="ignore",
+            use_container_width=True,
+            config=config,
         )
-    )
 
+    rerun_readout("route_counts", started)
 
-# ####################
-fig_direction_counts = px.line(
-    df_direction_ymd.query("channel == @selected_channel"),
-    x="weekday",
-    y="total_trips",
-    color="direction",
-)
 
-# Axis formatting
-fig_direction_counts.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text ="Day of week",
-                font=dict(
-                    size = 20
-                )
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-        ),
-        yaxis=dict(
-            title=dict(
-                text = f"Total {date_format.lower()} count",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-    ),
-    autosize=False,
-    width=500,
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
-    )
-)
+@st.fragment
+def hour_heatmap_section():
+    started = perf_counter()
 
-fig_channel_counts.update_traces(
-    # marker_color="red",
-)
+    st.divider()
 
-##################################################
-# MEAN DAILY PERCENTAGES
-df_week_sum = (
-    df.query("channel == @selected_channel & ym >= '2024-07'")
-    .groupby(by=["y", "week", "weekday"], as_index=False)
-    .agg(total_trips=("trips", "sum"))
-)
-
-df_week_sum["weekly_percent"] = df_week_sum.groupby(by=["y", "week"])[
-    "total_trips"
-].transform(lambda x: x / x.sum())
-
-fig_weekly = px.bar(
-    df_week_sum.groupby(by=["weekday"], as_index=False).agg(
-        weekly_mean=("weekly_percent", "mean")
-    ),
-    x="weekday",
-    y="weekly_mean",
-    text_auto="0.1%",
-)
+    st.subheader(f"Network trips by hour of day and day of year")
 
-# Axis formatting
-fig_weekly.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text = "Day of week",
-                font=dict(
-                    size = 20
-                )
-            ),
-            tickangle=30,
-            tickmode="array",
-            tickvals=[1, 2, 3, 4, 5, 6, 7],
-            ticktext=[
-                "Monday",
-                "Tuesday",
-                "Wednesday",
-                "Thursday",
-                "Friday",
-                "Saturday",
-                "Sunday",
-        ],
-            tickfont = dict(
-                size = 20
-            ),
-        ),
-        yaxis=dict(
-            title=dict(
-                text = "Average percent of weekly count",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-            tickformat=".0%",
-    ),
-    autosize=False,
-    width=500,
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
+    year = st.radio(
+        "Select year",
+        ["All years"] + list(range(window_start.year, window_end.year + 1)),
+        key="heatmap_year",
+        horizontal=True,
     )
-)
 
-fig_weekly.update_traces(
-    textposition="inside",
-    textfont_size=14,
-)
+    config = {
+        "toImageButtonOptions": {
+            "format": "png",
+            "filename": "hour_heatmap",
+            "scale": 5,
+        }
+    }
 
-col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns([0.1,0.8,0.1])
 
-with col1:
-    st.plotly_chart(fig_channel_counts, on_select="ignore")
-with col2:
+    with col2:
+        plotly_chart(
+            "hour_heatmap",
+            cached_figure("hour_heatmap", figures.build_hour_heatmap, year, window_start, window_end),
+            on_select="ignore",
+            use_container_width=True,
+            config=config,
+        )
 
-    df_display = (
-        df_channel_combined.query("channel == @selected_channel")
-        .drop(columns=["channel", "y", "m", "weekday", "ym", "year", "month", "day"])
-        .rename(columns={"ymd": "Date"})
-        .set_index("Date")
-    )
+    rerun_readout("hour_heatmap", started)
 
-    df_display.columns = df_display.columns.str.title().str.replace("_", " ")
-    st.write(df_display)
 
-# ##################################################
+@st.fragment
+def counter_history_section(selected_channel):
+    started = perf_counter()
 
-col1, col2 = st.columns(2)
+    st.subheader("Counter history")
+    date_format_channel = st.radio(
+        "Select date group format",
+        ["Daily ", "Monthly ", "Yearly ", "Year over year "],
+        index=1,
+        horizontal=True,
+    )
 
-#### Directionality
-with col1:
-    st.subheader("Average percent of weekly count by day of week")
-    st.plotly_chart(fig_weekly, on_select="ignore")
+    if date_format_channel == "Year over year ":
+        fig_channel_counts = cached_figure(
+            "year_over_year", figures.build_year_over_year, selected_channel, window_start, window_end
+        )
+    else:
+        fig_channel_counts = cached_figure(
+            "channel_counts",
+            figures.build_channel_counts,
+            selected_channel,
+            date_format_channel,
+            window_start,
+            window_end,
+        )
+    plotly_chart("channel_counts", fig_channel_counts, on_select="ignore")
 
-# MEAN HOURLY PERCENTAGES
-df_channel_hour = df.query("channel == @selected_channel & ym >= '2024-07'")
+    rerun_readout("counter_history", started, nested=True)
 
-option_map = {
-    1: "Monday",
-    2: "Tuesday",
-    3: "Wednesday",
-    4: "Thursday",
-    5: "Friday",
-    6: "Saturday",
-    7: "Sunday",
-}
 
-with col2:
+@st.fragment
+def hourly_section(selected_channel):
+    started = perf_counter()
 
     st.subheader("Average percent of daily count by hour of day") 
     
@@ -730,228 +580,282 @@ with col2:
         default=[1, 2, 3, 4, 5],
     )
 
-df_hour_sum = (
-    df_channel_hour.query("weekday in @selected_days")
-    .groupby(by=["y", "weekday", "hour", "direction"], as_index=False)
-    .agg(total_trips=("trips", "sum"))
-)
+    plotly_chart(
+        "hourly",
+        cached_figure(
+            "hourly",
+            partial(figures.build_hourly, profile_cache=get_hourly_profile_cache()),
+            selected_channel,
+            frozenset(selected_days),
+            window_start,
+            window_end,
+        ),
+        on_select="ignore",
+    )
 
-# Don't want to group by direction, want to normalize to total number of trips (both directions). This highlights routes with asymmetric counts.
-df_hour_sum["hourly_percent"] = df_hour_sum.groupby(by=["weekday"])[
-    "total_trips"
-].transform(lambda x: x / x.sum())
+    rerun_readout("hourly", started, nested=True)
 
-df_hour_mean = df_hour_sum.groupby(by=["direction", "hour"], as_index=False).agg(
-    hourly_mean=("hourly_percent", "mean")
-)
 
-fig_hourly = px.line(
-df_hour_mean,
-x="hour",
-y="hourly_mean",
-markers=True,
-color="direction",
-)
+@st.fragment
+def individual_counters_section():
+    started = perf_counter()
 
-# Axis formatting
-fig_hourly.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text = "Hour of Day",
-                font=dict(
-                    size = 20
-                )
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-            tickmode="array",
-            tickvals=[0, 3, 6, 9, 12, 15, 18, 21],
-            ticktext=[
-                "12 AM",
-                "3 AM",
-                "6 AM",
-                "9 AM",
-                "12 PM",
-                "3 PM",
-                "6 PM",
-                "9 PM",
-            ],
-        ),
-        yaxis=dict(
-            title=dict(
-                text = "Average percent of daily count",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-            tickformat=".0%",
-            range=[0, 0.1],
-    ),
-    legend=dict(
-        title=dict(text="Direction", font_size=20),
-        yanchor="top",
-        y=1,
-        xanchor="right",
-        x=1,
-        font=dict(size=16),
-        ),
-    autosize=False,
-    width=500,
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
-    )
-)
+    st.divider()
+    ######### Channel plot
+    st.header(f"Individual counters")
 
-with col2:
-    st.plotly_chart(fig_hourly, on_select="ignore")
+    col1, col2, col3 = st.columns(3)
 
-# ##############################
+    with col1:
+        selected_channel = st.selectbox("Select a route", channels, index=1)
 
-fig_temp_counts = px.scatter(
-    df_channel_combined.query(
-        "channel == @selected_channel & total_trips > 0 & y>= 2024 & total_rain == 0 & total_snow == 0 & total_precip == 0 & snow_on_ground == 0"
-    ),
-    x="mean_temp",
-    y="total_trips",
-)
+    # Prefix sums over the daily totals, so any window is two binary searches
+    totals = engine.window_totals(selected_channel, window_start, window_end)
+    with col2:
+        st.metric("Trips in date range", f"{totals['total_trips']:,}")
+    with col3:
+        st.metric(
+            "Average per day with counts",
+            f"{totals['total_trips'] / max(totals['active_days'], 1):,.0f}",
+        )
 
-# Axis formatting
-fig_temp_counts.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text = "Mean daily temperature",
-                font=dict(
-                    size = 20
-                )
+    col1, col2 = st.columns(2)
+
+    with col1:
+        counter_history_section(selected_channel)
+    with col2:
+
+        with profiler.stage("query.display_table") as record:
+            df_display = engine.display_table(selected_channel, window_start, window_end)
+            record["rows"] = len(df_display)
+        st.write(df_display)
+
+    # ##################################################
+
+    col1, col2 = st.columns(2)
+
+    #### Directionality
+    with col1:
+        st.subheader("Average percent of weekly count by day of week")
+        plotly_chart(
+            "weekly",
+            cached_figure("weekly", figures.build_weekly, selected_channel, window_start, window_end),
+            on_select="ignore",
+        )
+
+    # MEAN HOURLY PERCENTAGES
+    with col2:
+        hourly_section(selected_channel)
+
+    # ##########################################################################################
+    # Weather
+
+    st.divider()
+
+    config = {
+        "toImageButtonOptions": {"format": "png", "filename": "count_totals", "scale": 5}
+    }
+
+    st.header("Weather")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader(
+            f"Total daily count vs. mean daily temperature (days with no precipitation)"
+        )
+        plotly_chart(
+            "temp_counts",
+            cached_figure(
+                "temp_counts", figures.build_temp_counts, selected_channel, window_start, window_end
             ),
-            tickfont = dict(
-                size = 20
+            on_select="ignore",
+            use_container_width=True,
+            config=config,
+        )
+    with col2:
+        st.subheader(f"Total daily counts vs. daily rain")
+        plotly_chart(
+            "rain_counts",
+            cached_figure(
+                "rain_counts", figures.build_rain_counts, selected_channel, window_start, window_end
             ),
+            on_select="ignore",
+            use_container_width=True,
+            config=config,
+        )
+
+    st.subheader("Actual vs. expected daily count given the weather, weekday and season")
+    plotly_chart(
+        "expected_counts",
+        cached_figure(
+            "expected_counts",
+            figures.build_expected_counts,
+            selected_channel,
+            window_start,
+            window_end,
         ),
-        yaxis=dict(
-            title=dict(
-                text = "Total daily count",
-                font= dict(
-                    size = 20
-                ),
-            ),
-            tickfont = dict(
-                size = 20
-            ),
-    ),
-    autosize=False,
-    width=500,
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
+        on_select="ignore",
+        use_container_width=True,
+        config=config,
     )
-)
 
-config = {
-    "toImageButtonOptions": {"format": "png", "filename": "count_totals", "scale": 5}
-}
+    with st.expander("Anomalous days on all routes"):
+        df_anomalies = engine.anomalies(window_start, window_end)
+        st.dataframe(
+            df_anomalies.assign(ymd=df_anomalies.ymd.dt.date).rename(
+                columns={
+                    "channel": "Route",
+                    "ymd": "Date",
+                    "total_trips": "Actual",
+                    "expected_trips": "Expected",
+                }
+            )[["Route", "Date", "Actual", "Expected"]],
+            hide_index=True,
+        )
 
-# ##########################################################################################
-# Rain
+    rerun_readout("individual_counters", started)
 
-####### Plots
-st.divider()
-
-fig_rain_counts = px.scatter(
-    df_channel_combined.query(
-        "channel == @selected_channel & total_trips > 0 & y>= 2024 & total_rain != 0 & mean_temp >=0"
-    ),
-    x="total_rain",
-    y="total_trips",
-    color="mean_temp",
-)
 
-# Axis formatting
-fig_rain_counts.update_layout(
-    dict(
-        xaxis=dict(
-            title=dict(
-                text = "Total daily rain (mm)",
-                font=dict(
-                    size = 20
-                )
+@st.fragment
+def comparison_section():
+    started = perf_counter()
+
+    st.divider()
+
+    st.header("Compare counters")
+
+    selected_channels = tuple(
+        st.multiselect("Select routes to compare", channels, default=channels[:3])
+    )
+    if not selected_channels:
+        st.caption("Select at least one route.")
+        rerun_readout("comparison", started)
+        return
+
+    # Every chart gets all the selected routes from one batched lookup or
+    # grouped pass, so adding routes barely changes the latency
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("Monthly counts")
+        plotly_chart(
+            "compare_counts",
+            cached_figure(
+                "compare_counts", figures.build_compare_counts, selected_channels, window_start, window_end
             ),
-            tickfont = dict(
-                size = 20
+            on_select="ignore",
+        )
+    with col2:
+        st.subheader("Average percent of weekly count by day of week")
+        plotly_chart(
+            "compare_weekly",
+            cached_figure(
+                "compare_weekly", figures.build_compare_weekly, selected_channels, window_start, window_end
             ),
-        ),
-        yaxis=dict(
-            title=dict(
-                text = "Total daily count",
-                font= dict(
-                    size = 20
-                ),
+            on_select="ignore",
+        )
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("Average percent of daily count by hour of day")
+        compare_days = st.pills(
+            "Select day(s) of the week",
+            options=option_map.keys(),
+            format_func=lambda option: option_map[option],
+            selection_mode="multi",
+            default=[1, 2, 3, 4, 5],
+            key="compare_days",
+        )
+        plotly_chart(
+            "compare_hourly",
+            cached_figure(
+                "compare_hourly",
+                figures.build_compare_hourly,
+                selected_channels,
+                frozenset(compare_days),
+                window_start,
+                window_end,
             ),
-            tickfont = dict(
-                size = 20
+            on_select="ignore",
+        )
+    with col2:
+        st.subheader("Total daily count vs. mean daily temperature (days with no precipitation)")
+        plotly_chart(
+            "compare_temp_counts",
+            cached_figure(
+                "compare_temp_counts",
+                figures.build_compare_temp_counts,
+                selected_channels,
+                window_start,
+                window_end,
             ),
-    ),
-    coloraxis_colorbar=dict(
-        title="Mean temp",
-    ),
-    autosize=False,
-    width=1000,
-    height=600,
-    margin=dict(l=0, r=0, t=0, b=0),
-    font_color="black",
-    )
-)
-
-config = {
-    "toImageButtonOptions": {"format": "png", "filename": "count_totals", "scale": 5}
-}
+            on_select="ignore",
+        )
 
-st.header("Weather")
+    rerun_readout("comparison", started)
 
-col1, col2 = st.columns(2)
 
-with col1:
-    st.subheader(
-        f"Total daily count vs. mean daily temperature (days with no precipitation since 2024)"
-    )
-    st.plotly_chart(
-        fig_temp_counts, on_select="ignore", use_container_width=True, config=config
-    )
-with col2:
-    st.subheader(f"Total daily counts vs. daily rain (since 2024)")
-    st.plotly_chart(
-        fig_rain_counts, on_select="ignore", use_container_width=True, config=config
-    )
+history_section()
+route_counts_section()
+hour_heatmap_section()
+individual_counters_section()
+comparison_section()
 
 
 # ####### Data Exports
-# csv = convert_for_download(df_ymd)
-
-with st.sidebar:
+def read_export(channels, start, end, fmt):
+    # Only runs when the download button is clicked. The extract is streamed
+    # from the store to disk in chunks, or reused if it was built before.
+    path = export.export(STORE_DIR, manifest, EXPORT_DIR, channels, start, end, fmt)
+    return path.read_bytes()
+
+
+@st.fragment
+def export_section():
+    with st.expander("Download data", icon=":material/download:"):
+        export_channels = st.multiselect("Routes", channels, default=channels)
+        export_dates = st.date_input(
+            "Dates", (min_date, max_date), min_value=min_date, max_value=max_date
+        )
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True)
+
+        # The range is a single date while the second end is being picked, and
+        # empty if the input was cleared
+        if export_dates:
+            start, end = export_dates if len(export_dates) == 2 else export_dates * 2
+        else:
+            start, end = min_date, max_date
+        st.download_button(
+            label="Download hourly counts",
+            data=partial(read_export, tuple(export_channels), start, end, fmt),
+            file_name=f"hourly_cycling_counts_{start:%Y%m%d}_{end:%Y%m%d}.{fmt}",
+            mime=export.MIME_TYPES[fmt],
+            icon=":material/download:",
+            on_click="ignore",
+            disabled=not export_channels or not export_dates,
+        )
 
-    st.title("Historical Halifax Cycling Dashboard")
 
-    st.markdown(
-        "Created by [John Niven](https://bsky.app/profile/johnniven.bsky.social)"
-    )
-
-    st.subheader(f"Data updated {max_date}")
+with st.sidebar:
 
-    # st.download_button(
-    #     label="Download data",
-    #     data=csv,
-    #     file_name=f"daily_cycling_counts_{max_date}.csv",
-    #     mime="text/csv",
-    #     icon=":material/download:",
-    # )
+    export_section()
 
     st.markdown(
         "[View raw data](https://catalogue-hrm.opendata.arcgis.com/datasets/45d4ecb0cb48469186e683ebc54eb188_0/explore)"
     )
+
+    if profiler.enabled:
+        with st.expander("Profiling", expanded=True):
+            st.caption("Most recent stages of this session, newest last. Fragment reruns show up here after the next full rerun.")
+            st.dataframe(pd.DataFrame(list(profiler.records)), hide_index=True)
+
+            refresher = get_refresher()
+            st.caption(f"Data version {data_version}, last checked {refresher.last_checked:%H:%M:%S}")
+            cache_stats = {
+                "engine": {"loads": refresher.loads},
+                "figures": get_figure_cache().stats(),
+                "hourly profiles": get_hourly_profile_cache().stats(),
+            }
+            st.dataframe(pd.DataFrame(cache_stats).T)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_counts(start, end, channels=("Hollis St", "South Park St"), directions=("Northbound", "Southbound")):
+    """Hourly counter rows shaped like data/clean_cycle_data.feather."""
+    days = pd.date_range(start, end, freq="D")
+    index = pd.MultiIndex.from_product(
+        [list(channels), list(directions), days, range(24)],
+        names=["channel", "direction", "date", "hour"],
+    )
+    df = index.to_frame(index=False)
+    rng = np.random.default_rng(0)
+    df["trips"] = rng.integers(0, 20, len(df))
+    df["ymd"] = df.date.dt.strftime("%Y-%m-%d")
+    df["ym"] = df.date.dt.strftime("%Y-%m")
+    df["y"] = df.date.dt.year.astype("int32")
+    df["m"] = df.date.dt.month.astype("int32")
+    df["week"] = df.date.dt.isocalendar().week.astype("int64").to_numpy()
+    df["weekday"] = (df.date.dt.dayofweek + 1).astype("int32")
+    df["hour"] = df.hour.astype("int32")
+    return df.drop(columns="date")
+
+
+def make_weather(start, end):
+    """Daily weather rows shaped like data/weather_data.csv, with some values missing."""
+    days = pd.date_range(start, end, freq="D")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "ymd": days.strftime("%Y-%m-%d"),
+        "year": days.year,
+        "month": days.month,
+        "day": days.day,
+        "mean_temp": rng.uniform(-10, 30, len(days)).round(1),
+        "total_rain": rng.choice([0, 0, 0, 1.5, 12.0], len(days)),
+        "total_snow": rng.choice([0, 0, 0, 0, 3.0], len(days)),
+        "snow_on_ground": rng.choice([0, 0, 0, 2.0], len(days)),
+    })
+    df["total_precip"] = df.total_rain + df.total_snow
+    for col in ["mean_temp", "total_rain", "snow_on_ground"]:
+        df.loc[rng.random(len(days)) < 0.1, col] = np.nan
+    return df
+
+
+@pytest.fixture
+def counts():
+    return make_counts("2024-05-01", "2024-06-30")
+
+
+@pytest.fixture
+def store_dir(tmp_path, counts):
+    from cycling import store
+
+    source = tmp_path / "counts.feather"
+    counts.to_feather(source)
+    store_dir = tmp_path / "store"
+    with store.write_lock(store_dir):
+        store.bootstrap(source, store_dir)
+    return store_dir
+
+
+@pytest.fixture
+def weather_file(tmp_path):
+    path = tmp_path / "weather.csv"
+    make_weather("2024-01-01", "2024-12-31").to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def engine(store_dir, weather_file):
+    from cycling import store
+    from cycling.engine import Engine
+    from cycling.weather import load_weather
+
+    return Engine(store_dir, store.read_manifest(store_dir), load_weather(weather_file))
@@ -0,0 +1,146 @@
+import pandas as pd
+import pytest
+
+from cycling.engine import Query
+
+
+def raw_rows(counts, channels=None, weekdays=None, start=None, end=None):
+    df = counts.assign(ymd=pd.to_datetime(counts.ymd), ym=pd.to_datetime(counts.ym))
+    if channels is not None:
+        df = df[df.channel.isin(channels)]
+    if weekdays is not None:
+        df = df[df.weekday.isin(weekdays)]
+    if start is not None:
+        df = df[df.ymd >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df.ymd <= pd.Timestamp(end)]
+    return df
+
+
+def assert_same_rows(actual, expected, keys, value):
+    actual = actual.sort_values(keys, ignore_index=True)
+    expected = expected.sort_values(keys, ignore_index=True)
+    assert actual[keys].astype(str).equals(expected[keys].astype(str))
+    pd.testing.assert_series_equal(actual[value], expected[value], check_dtype=False, check_names=False)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        # Served from rollup levels
+        Query(),
+        Query(group_by=("channel", "y")),
+        Query(group_by=("channel", "ymd"), channels=("Hollis St",), start="2024-05-10", end="2024-06-02"),
+        Query(group_by=("weekday",), weekdays=frozenset({6, 7})),
+        Query(group_by=("channel", "hour", "direction")),
+        # No rollup has both direction and ymd, so these scan the hourly rows
+        Query(group_by=("direction", "ymd"), start="2024-06-10"),
+        Query(group_by=("channel", "direction", "hour"), weekdays=frozenset({1}), end="2024-05-20"),
+    ],
+)
+def test_total_trips_match_groupby(engine, counts, query):
+    df = raw_rows(counts, query.channels, query.weekdays, query.start, query.end)
+    if not query.group_by:
+        assert engine.query(query).total_trips.item() == df.trips.sum()
+        return
+
+    expected = df.groupby(list(query.group_by), as_index=False).trips.sum().rename(
+        columns={"trips": "total_trips"}
+    )
+    assert_same_rows(engine.query(query), expected, list(query.group_by), "total_trips")
+
+
+def test_query_picks_the_smallest_covering_rollup(engine):
+    df, value_col = engine._covering_rows(Query(group_by=("channel", "y")))
+    assert value_col == "total_trips" and len(df) == len(engine.cube["channel_y"])
+
+    df, value_col = engine._covering_rows(Query(group_by=("direction", "ymd")))
+    assert value_col == "trips" and set(df.columns) == {"direction", "ymd", "trips"}
+
+
+@pytest.mark.parametrize("group_by", [("channel",), ()])
+def test_weekly_share_matches_groupby(engine, counts, group_by):
+    by = list(group_by)
+    query = Query(metric="weekly_share", group_by=group_by, channels=("Hollis St",), start="2024-06-01")
+
+    df = raw_rows(counts, query.channels, start=query.start)
+    df_week = df.groupby(by + ["y", "week", "weekday"], as_index=False).trips.sum()
+    df_week["share"] = df_week.trips / df_week.groupby(by + ["y", "week"]).trips.transform("sum")
+    expected = df_week.groupby(by + ["weekday"], as_index=False).share.mean()
+
+    assert_same_rows(engine.query(query).rename(columns={"weekly_mean": "share"}), expected, by + ["weekday"], "share")
+
+
+@pytest.mark.parametrize("group_by", [("channel",), ()])
+def test_hourly_share_matches_groupby(engine, counts, group_by):
+    by = list(group_by)
+    query = Query(metric="hourly_share", group_by=group_by, weekdays=frozenset({1, 2, 3}), end="2024-05-31")
+
+    df = raw_rows(counts, weekdays=query.weekdays, end=query.end)
+    df_hour = df.groupby(by + ["y", "weekday", "hour", "direction"], as_index=False).trips.sum()
+    df_hour["share"] = df_hour.trips / df_hour.groupby(by + ["y", "weekday"]).trips.transform("sum")
+    expected = df_hour.groupby(by + ["direction", "hour"], as_index=False).share.mean()
+
+    actual = engine.query(query).rename(columns={"hourly_mean": "share"})
+    assert_same_rows(actual, expected, by + ["direction", "hour"], "share")
+
+
+def test_query_rejects_unknown_metrics_and_keys(engine):
+    with pytest.raises(ValueError):
+        engine.query(Query(metric="median_trips"))
+    with pytest.raises(ValueError):
+        engine.query(Query(group_by=("total_trips",)))
+
+
+PROFILE_WINDOWS = [
+    # A weekend and the start of a week, both inside one ISO week
+    ("2024-05-18", "2024-05-19"),
+    ("2024-05-13", "2024-05-14"),
+    # Partial weeks at both edges, across a month boundary
+    ("2024-05-09", "2024-06-12"),
+    ("2024-06-03", None),
+    (None, "2024-05-22"),
+    (None, None),
+]
+
+
+def expected_weekly_profile(counts, channels, start, end):
+    df = raw_rows(counts, channels, start=start, end=end)
+    df_week = df.groupby(["channel", "y", "week", "weekday"], as_index=False).trips.sum()
+    df_week["share"] = df_week.trips / df_week.groupby(["channel", "y", "week"]).trips.transform("sum")
+    return df_week.groupby(["channel", "weekday"], as_index=False).share.mean()
+
+
+@pytest.mark.parametrize("start, end", PROFILE_WINDOWS)
+def test_weekly_profile_matches_filtering(engine, counts, start, end):
+    channels = ["South Park St", "unknown", "Hollis St"]
+    expected = expected_weekly_profile(counts, channels, start, end)
+
+    actual = engine.weekly_profiles(channels, start, end).rename(columns={"weekly_mean": "share"})
+    assert_same_rows(actual, expected, ["channel", "weekday"], "share")
+
+    single = engine.weekly_profile("Hollis St", start, end).rename(columns={"weekly_mean": "share"})
+    assert_same_rows(single, expected[expected.channel == "Hollis St"], ["channel", "weekday"], "share")
+
+
+def test_weekly_profile_of_a_weekend_has_only_its_days(engine):
+    assert engine.weekly_profile("Hollis St", "2024-05-18", "2024-05-19").weekday.tolist() == [6, 7]
+    assert engine.weekly_profile("Hollis St", "2024-05-13", "2024-05-14").weekday.tolist() == [1, 2]
+    assert engine.weekly_profile("Hollis St", "2030-01-01", "2030-01-07").empty
+
+
+@pytest.mark.parametrize("weekdays", [[6, 7], [1, 2, 3, 4, 5]])
+@pytest.mark.parametrize("start, end", PROFILE_WINDOWS)
+def test_hourly_profile_matches_filtering(engine, counts, start, end, weekdays):
+    channels = ["Hollis St", "South Park St"]
+    df = raw_rows(counts, channels, weekdays, start, end)
+    df_hour = df.groupby(["channel", "y", "weekday", "hour", "direction"], as_index=False).trips.sum()
+    df_hour["share"] = df_hour.trips / df_hour.groupby(["channel", "y", "weekday"]).trips.transform("sum")
+    expected = df_hour.groupby(["channel", "direction", "hour"], as_index=False).share.mean()
+
+    keys = ["channel", "direction", "hour"]
+    actual = engine.hourly_profiles(channels, weekdays, start, end).rename(columns={"hourly_mean": "share"})
+    assert_same_rows(actual, expected, keys, "share")
+
+    single = engine.hourly_profile("Hollis St", weekdays, start, end).rename(columns={"hourly_mean": "share"})
+    assert_same_rows(single, expected[expected.channel == "Hollis St"], keys, "share")
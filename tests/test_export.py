@@ -0,0 +1,59 @@
+import pandas as pd
+import pyarrow.parquet as pq
+
+from cycling import export, store
+
+
+def test_csv_round_trip_matches_load_counts(store_dir, tmp_path):
+    manifest = store.read_manifest(store_dir)
+    channels, start, end = ["South Park St"], "2024-05-30", "2024-06-02"
+
+    path = export.export(store_dir, manifest, tmp_path / "exports", channels, start, end, "csv")
+
+    df_csv = pd.read_csv(path, dtype={"ymd": str, "ym": str})
+    assert list(df_csv.columns) == store.COUNT_COLUMNS
+    assert df_csv.ym.unique().tolist() == ["2024-05", "2024-06"]
+
+    expected = store.load_counts(store_dir, manifest, start, end, channels)
+    pd.testing.assert_frame_equal(
+        store.normalize_schema(df_csv).sort_values(store.ROW_KEYS, ignore_index=True),
+        expected[store.COUNT_COLUMNS].sort_values(store.ROW_KEYS, ignore_index=True),
+        check_dtype=False,
+        check_categorical=False,
+    )
+
+
+def test_parquet_matches_load_counts(store_dir, tmp_path):
+    manifest = store.read_manifest(store_dir)
+
+    path = export.export(store_dir, manifest, tmp_path / "exports", None, "2024-06-10", None, "parquet")
+
+    expected = store.load_counts(store_dir, manifest, start="2024-06-10")
+    assert pq.read_table(path).num_rows == len(expected)
+    assert pd.read_parquet(path).trips.sum() == expected.trips.sum()
+
+
+def test_empty_range_writes_an_empty_file(store_dir, tmp_path):
+    manifest = store.read_manifest(store_dir)
+    start, end = "2030-01-01", "2030-01-31"
+
+    csv_path = export.export(store_dir, manifest, tmp_path / "exports", None, start, end, "csv")
+    assert csv_path.read_text() == ",".join(store.COUNT_COLUMNS) + "\n"
+
+    parquet_path = export.export(store_dir, manifest, tmp_path / "exports", None, start, end, "parquet")
+    table = pq.read_table(parquet_path)
+    assert table.num_rows == 0
+    assert table.column_names == store.COUNT_COLUMNS
+
+
+def test_second_export_reuses_the_cached_file(store_dir, tmp_path):
+    manifest = store.read_manifest(store_dir)
+    args = (store_dir, manifest, tmp_path / "exports", ["Hollis St", "South Park St"], "2024-06-01", "2024-06-01", "csv")
+
+    first = export.export(*args)
+    first.write_text("cached")
+
+    # Channel order doesn't change the extract
+    second = export.export(*args[:3], ["South Park St", "Hollis St"], *args[4:])
+    assert second == first
+    assert second.read_text() == "cached"
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from cycling import hourly
+
+
+def test_day_of_leap_year_lines_up_calendar_days():
+    dates = pd.to_datetime(["2021-02-28", "2021-03-01", "2024-02-29", "2024-03-01", "2021-12-31"])
+    assert hourly.day_of_leap_year(dates).tolist() == [58, 60, 59, 60, 365]
+
+
+def test_hour_by_day_of_year_averages_the_same_calendar_day():
+    dates = pd.date_range("2021-01-01", "2024-12-31", freq="D")
+    trips = np.zeros((1, len(dates), hourly.HOURS, 1), dtype="int32")
+    trips[0, dates.get_loc(pd.Timestamp("2021-03-01")), 8] = 10
+    trips[0, dates.get_loc(pd.Timestamp("2024-03-01")), 8] = 20
+    trips[0, dates.get_loc(pd.Timestamp("2024-02-29")), 8] = 5
+    cube = hourly.HourlyCube(trips=trips, channels=("A",), dates=dates, directions=("N",))
+
+    heatmap = cube.hour_by_day_of_year()
+    assert heatmap[8, 60] == 15
+    assert heatmap[8, 59] == 5
+    assert np.isnan(heatmap[8, 0])
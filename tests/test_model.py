@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from cycling import model
+
+
+def test_batched_fit_matches_a_solve_per_channel(engine):
+    df = engine.rows("channel_combined")
+    coefficients = model.fit(df)
+
+    assert coefficients.index.tolist() == engine.channels
+    for channel in engine.channels:
+        df_channel = df[(df.channel == channel) & (df.total_trips > 0)]
+        X = model.design_matrix(df_channel)
+        y = np.log1p(df_channel.total_trips.to_numpy())
+        penalty = model.RIDGE * np.eye(X.shape[1])
+        penalty[0, 0] = 0
+
+        expected = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+        np.testing.assert_allclose(coefficients.loc[channel].to_numpy(), expected, rtol=0, atol=1e-10)
+
+
+def test_channel_without_trips_gets_no_expectations_or_anomalies(engine):
+    df = engine.rows("channel_combined")
+    # Sorted between the other two channels
+    df_zero = df[df.channel == "Hollis St"].assign(channel="Middle St", total_trips=0)
+    df = (
+        pd.concat([df, df_zero], ignore_index=True)
+        .astype({"channel": str})
+        .sort_values(["channel", "ymd"], ignore_index=True)
+    )
+
+    scored = model.expected_counts(df)
+
+    zero = scored[scored.channel == "Middle St"]
+    assert len(zero) == len(df_zero)
+    assert zero.expected_trips.isna().all()
+    assert not zero.anomaly.any()
+    assert scored[scored.channel != "Middle St"].expected_trips.notna().all()
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cycling import ranges
+
+
+@pytest.fixture
+def df_daily():
+    # Two channels sorted by channel and date, with gaps and a leap day
+    rng = np.random.default_rng(1)
+    frames = []
+    for channel, start, end in [("A", "2023-01-01", "2024-12-31"), ("B", "2023-06-15", "2024-03-31")]:
+        dates = pd.date_range(start, end, freq="D")
+        dates = dates[rng.random(len(dates)) > 0.1]
+        frames.append(
+            pd.DataFrame({
+                "channel": channel,
+                "ymd": dates,
+                "total_trips": rng.integers(0, 500, len(dates)),
+                "days": 1,
+            })
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture
+def prefix_sums(df_daily):
+    return ranges.PrefixSums.build(df_daily, "ymd", ["total_trips", "days"])
+
+
+def expected_rows(df, channel, start=None, end=None):
+    mask = df.channel == channel
+    if start is not None:
+        mask &= df.ymd >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df.ymd <= pd.Timestamp(end)
+    return df[mask]
+
+
+WINDOWS = [
+    (None, None),
+    ("2023-07-01", "2023-12-31"),
+    ("2024-02-29", "2024-02-29"),
+    ("2022-01-01", "2023-06-20"),
+    # Outside the data and reversed
+    ("2030-01-01", "2030-12-31"),
+    ("2019-01-01", "2019-12-31"),
+    ("2024-03-01", "2024-01-01"),
+]
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+@pytest.mark.parametrize("channel", ["A", "B", "unknown"])
+def test_slice_window_matches_filtering(df_daily, channel, start, end):
+    runs = ranges.channel_runs(df_daily.channel)
+    expected = expected_rows(df_daily, channel, start, end)
+
+    pd.testing.assert_frame_equal(ranges.slice_window(df_daily, "ymd", runs, channel, start, end), expected)
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_slice_window_of_several_channels(df_daily, start, end):
+    runs = ranges.channel_runs(df_daily.channel)
+    expected = pd.concat([expected_rows(df_daily, channel, start, end) for channel in ["B", "A"]])
+
+    pd.testing.assert_frame_equal(
+        ranges.slice_window(df_daily, "ymd", runs, ["B", "unknown", "A"], start, end), expected
+    )
+    pd.testing.assert_frame_equal(
+        ranges.slice_window(df_daily, "ymd", runs, None, start, end).sort_index(),
+        expected.sort_index(),
+    )
+    assert ranges.slice_window(df_daily, "ymd", runs, [], start, end).empty
+
+
+def test_window_is_empty_when_it_misses_the_rows():
+    dates = pd.date_range("2024-01-01", periods=10, freq="D").to_numpy()
+    assert ranges.window(dates, 2, 8, "2024-01-04", "2024-01-05") == (3, 5)
+    assert ranges.window(dates, 2, 8, "2025-01-01", None) == (8, 8)
+    assert ranges.window(dates, 2, 8, None, "2023-01-01") == (2, 2)
+    assert ranges.window(dates, 2, 8, "2024-01-06", "2024-01-04") == (5, 5)
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+@pytest.mark.parametrize("channel", ["A", "B", "unknown"])
+def test_total_and_count_match_filtering(df_daily, prefix_sums, channel, start, end):
+    expected = expected_rows(df_daily, channel, start, end)
+
+    total = prefix_sums.total(channel, start, end)
+    assert total.to_dict() == {"total_trips": expected.total_trips.sum(), "days": len(expected)}
+    assert prefix_sums.count(channel, start, end) == len(expected)
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_totals_match_total(prefix_sums, start, end):
+    channels = ["B", "unknown", "A"]
+    expected = np.array([prefix_sums.total(channel, start, end).to_numpy() for channel in channels])
+
+    np.testing.assert_array_equal(prefix_sums.totals(channels, start, end), expected)
+
+
+@pytest.mark.parametrize("days", [1, 7, 28, 365])
+def test_rolling_matches_pandas(df_daily, prefix_sums, days):
+    expected = (
+        df_daily.set_index("ymd")
+        .groupby("channel")
+        .total_trips.rolling(f"{days}D")
+        .sum()
+        .to_numpy()
+    )
+    np.testing.assert_array_equal(prefix_sums.rolling("total_trips", days), expected)
+
+
+def test_year_to_date_matches_pandas(df_daily, prefix_sums):
+    expected = df_daily.groupby(["channel", df_daily.ymd.dt.year]).total_trips.cumsum().to_numpy()
+    np.testing.assert_array_equal(prefix_sums.year_to_date("total_trips"), expected)
+
+
+def test_year_to_date_a_year_back(df_daily, prefix_sums):
+    expected = []
+    for row in df_daily.itertuples():
+        same_day = row.ymd - pd.DateOffset(years=1)
+        earlier = expected_rows(df_daily, row.channel, f"{same_day.year}-01-01", same_day)
+        expected.append(earlier.total_trips.sum())
+
+    np.testing.assert_array_equal(prefix_sums.year_to_date("total_trips", years_back=1), expected)
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from cycling import refresh, store
+
+from conftest import make_counts
+
+
+def test_unreadable_incoming_files_are_set_aside(store_dir, tmp_path):
+    incoming_dir = tmp_path / "incoming"
+    incoming_dir.mkdir()
+    make_counts("2024-07-01", "2024-07-02").to_parquet(incoming_dir / "b_july.parquet")
+    (incoming_dir / "a_broken.parquet").write_bytes(b"not parquet")
+    (incoming_dir / "c_columns.csv").write_text("channel,trips\nHollis St,3\n")
+
+    manifest = refresh.ingest_incoming(incoming_dir, store_dir)
+
+    assert "2024-07" in manifest["partitions"]
+    assert sorted(path.name for path in (incoming_dir / "done").iterdir()) == ["b_july.parquet"]
+    assert sorted(path.name for path in (incoming_dir / "failed").iterdir()) == [
+        "a_broken.parquet",
+        "c_columns.csv",
+    ]
+    assert refresh.ingest_incoming(incoming_dir, store_dir) is None
+
+
+def test_concurrent_writers_bootstrap_the_store_once(tmp_path):
+    source = tmp_path / "counts.feather"
+    make_counts("2024-05-01", "2024-05-31").to_feather(source)
+
+    with ThreadPoolExecutor(4) as pool:
+        manifests = list(pool.map(lambda _: store.ensure_store(source, tmp_path / "store"), range(4)))
+
+    assert {(manifest["store_id"], manifest["version"]) for manifest in manifests} == {
+        (manifests[0]["store_id"], 1)
+    }
+
+
+def test_concurrent_refreshers_ingest_each_file_once(store_dir, tmp_path):
+    incoming_dir = tmp_path / "incoming"
+    incoming_dir.mkdir()
+    df_july = make_counts("2024-07-01", "2024-07-02")
+    df_july.to_parquet(incoming_dir / "july.parquet")
+
+    with ThreadPoolExecutor(4) as pool:
+        manifests = list(pool.map(lambda _: refresh.ingest_incoming(incoming_dir, store_dir), range(4)))
+
+    assert sum(manifest is not None for manifest in manifests) == 1
+    assert [path.name for path in (incoming_dir / "done").iterdir()] == ["july.parquet"]
+    df = store.load_counts(store_dir, store.read_manifest(store_dir), start="2024-07-01")
+    assert df.trips.sum() == df_july.trips.sum()
+
+
+def test_write_lock_is_reentrant(store_dir):
+    with store.write_lock(store_dir):
+        manifest = store.ingest(make_counts("2024-07-01", "2024-07-01"), store_dir)
+    assert "2024-07" in manifest["partitions"]
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from cycling import store
+
+from conftest import make_counts
+
+
+def test_ingest_replaces_repeated_rows_in_a_new_month(store_dir):
+    df_july = make_counts("2024-07-01", "2024-07-31")
+
+    manifest = store.ingest(
+        pd.concat([df_july, df_july], ignore_index=True), store_dir
+    )
+    df = store.load_counts(store_dir, manifest, start="2024-07-01")
+    assert df.trips.sum() == df_july.trips.sum()
+    assert not df.duplicated(subset=store.ROW_KEYS).any()
+
+
+def test_ingest_keeps_the_last_value_of_a_repeated_row(store_dir):
+    df_july = make_counts("2024-07-01", "2024-07-01", channels=["Hollis St"])
+    df_later = df_july.assign(trips=df_july.trips + 100)
+
+    manifest = store.ingest(
+        pd.concat([df_july, df_later], ignore_index=True), store_dir
+    )
+    df = store.load_counts(store_dir, manifest, start="2024-07-01")
+    assert df.trips.sum() == df_later.trips.sum()
+
+    rollups = store.load_rollups(store_dir, manifest)
+    df_ym = rollups["ym"]
+    july = df_ym[df_ym.ym == pd.Timestamp("2024-07-01")]
+    assert july.total_trips.sum() == df_later.trips.sum()
+
+
+def test_rebuilt_store_gets_a_new_version_token(tmp_path):
+    source = tmp_path / "counts.feather"
+    make_counts("2024-05-01", "2024-05-31").to_feather(source)
+    first = store.bootstrap(source, tmp_path / "store")
+    second = store.bootstrap(source, tmp_path / "rebuilt")
+
+    assert first["version"] == second["version"] == 1
+    assert store.data_version(first, "w") != store.data_version(second, "w")
+
+
+def test_ingest_keeps_the_store_id(store_dir):
+    previous = store.read_manifest(store_dir)
+    manifest = store.ingest(make_counts("2024-07-01", "2024-07-01"), store_dir)
+
+    assert manifest["store_id"] == previous["store_id"]
+    assert store.store_version(manifest) != store.store_version(previous)
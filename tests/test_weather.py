@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from cycling import weather
+
+# The filters the dashboard used before the `conditions` bitmap
+DRY_QUERY = "total_trips > 0 & total_rain == 0 & total_snow == 0 & total_precip == 0 & snow_on_ground == 0"
+RAIN_QUERY = "total_trips > 0 & total_rain != 0 & mean_temp >=0"
+
+
+def test_fixture_has_missing_weather(engine):
+    df = engine.rows("channel_combined")
+    for col in ["total_rain", "mean_temp", "snow_on_ground"]:
+        assert df[col].isna().any()
+
+
+@pytest.mark.parametrize("start, end", [(None, None), ("2024-05-20", "2024-06-05")])
+@pytest.mark.parametrize("channel", ["Hollis St", "South Park St"])
+def test_dry_and_rain_days_match_the_old_queries(engine, channel, start, end):
+    df = engine.window_rows("channel_combined", channel, start, end)
+
+    for days, query in [(engine.dry_days, DRY_QUERY), (engine.rain_days, RAIN_QUERY)]:
+        expected = df.query(query)
+        actual = days(channel, start=start, end=end)
+        assert len(expected) > 0
+        assert actual.ymd.tolist() == expected.ymd.tolist()
+
+
+def test_condition_flags_treat_missing_values_like_comparisons(engine):
+    df = engine.weather
+    flags = df.conditions.to_numpy()
+
+    np.testing.assert_array_equal(
+        weather.select(flags, all_of=weather.DRY),
+        df.eval("total_rain == 0 & total_snow == 0 & total_precip == 0 & snow_on_ground == 0").to_numpy(),
+    )
+    np.testing.assert_array_equal(
+        weather.select(flags, all_of=weather.RAIN, any_of=weather.ABOVE_FREEZING),
+        df.eval("total_rain != 0 & mean_temp >= 0").to_numpy(),
+    )
+    # A day without a temperature is in no band
+    missing_temp = df.mean_temp.isna().to_numpy()
+    assert not (flags[missing_temp] & (weather.FREEZING | weather.ABOVE_FREEZING)).any()